@@ -0,0 +1,216 @@
+"""
+Benchmarks of the search algorithms.
+Run `python3 benchmark.py --output benchmark.json` to measure search throughput on a fixed corpus of mid-round
+states, time of the state operations and seeded head-to-head win rates. Results are written as JSON, so runs
+on different commits can be diffed. Run `python3 benchmark.py --tree-parallel` to compare tree-parallel ISMCTS
+with the serial search.
+"""
+
+import argparse
+import json
+import random
+import time
+from collections import defaultdict
+
+from game import LoveLetterState, load_decks
+from ismcts import ISMCTS, Smart_ISMCTS
+from minimax import Minimax
+from rule_based import get_move
+from stats import SearchStats
+from tournament import play_game, summarize
+from uct import Determinized_UCT
+
+
+def build_states(decks, number, seed=0):
+    """
+    Build states at the beginning of a round where the search can't be skipped by rule based moves
+    :param decks: decks specified in advance
+    :param number: number of states to build
+    :param seed: seed of the random stream of the states
+    :return: list of states
+    """
+    rng = random.Random(seed)
+    states = []
+    while len(states) < number:
+        state = LoveLetterState(2, decks, rng)
+        state.start_new_round()
+        if get_move(state, ismcts=True)[0] is None:
+            states.append(state)
+    return states
+
+
+def iterations_per_second(search, states, itermax):
+    """
+    :param search: function searching from a packed state for given number of iterations
+    :return: average number of iterations per second
+    """
+    start = time.time()
+    for state in states:
+        search(state.compact(), itermax)
+    return len(states) * itermax / (time.time() - start)
+
+
+def play_rounds(agents, decks, rounds, seed=0):
+    """
+    Play rounds between two agents, the first player of every round is chosen randomly
+    :param agents: list of two functions returning move, victim and guess for a state
+    :return: number of rounds won by each agent
+    """
+    rng = random.Random(seed)
+    wins = defaultdict(int)
+    for _ in range(rounds):
+        state = LoveLetterState(2, decks, rng)
+        state.start_new_round()
+        while not state.round_over:
+            agent = agents[state.playerToMove.uid - 1]
+            move, victim, guess = agent(state)
+            state.do_move(move, victim=victim, guess=guess, vanilla=False)
+        wins[state.get_winner().uid - 1] += 1
+    return [wins[0], wins[1]]
+
+
+def compare_tree_parallel(decks, itermax=2000, threads=4, rounds=50):
+    serial, parallel = Smart_ISMCTS(rng=random.Random(0)), Smart_ISMCTS(rng=random.Random(1))
+    states = build_states(decks, 10)
+
+    print("Serial: {:.0f} iterations/sec".format(
+        iterations_per_second(lambda snapshot, n: serial.search(snapshot, n, vanilla=False), states, itermax)))
+    print("Tree-parallel, {} threads: {:.0f} iterations/sec".format(threads, iterations_per_second(
+        lambda snapshot, n: parallel.tree_parallel_search(snapshot, n, threads, vanilla=False), states, itermax)))
+
+    wins = play_rounds([lambda state: serial.get_move(state, itermax),
+                        lambda state: parallel.get_move(state, itermax, threads=threads)], decks, rounds)
+    print("Rounds won: serial {}, tree-parallel {}".format(*wins))
+
+
+def build_corpus(decks, number, seed=0, players=2, max_moves=6):
+    """
+    Build states in the middle of a round, reached by rule based moves, where the search can't be skipped
+    :param number: number of states to build
+    :param max_moves: maximal number of moves made before the state
+    :return: list of states
+    """
+    rng = random.Random(seed)
+    states = []
+    while len(states) < number:
+        state = LoveLetterState(players, decks, rng)
+        state.start_new_round()
+        for _ in range(rng.randint(1, max_moves)):
+            move, victim, guess = get_move(state)
+            state.do_move(move, victim=victim, guess=guess, vanilla=False)
+            if state.round_over:
+                break
+        if not state.round_over and get_move(state, ismcts=True)[0] is None:
+            states.append(state)
+    return states
+
+
+def search_throughput(states, itermax=1000, determinizations=50, seed=0):
+    """
+    :return: iterations per second of every algorithm on the states, determinizations per second for Minimax
+    """
+    searches = [
+        ('ismcts', lambda state, rng, stats: ISMCTS(rng=rng).get_move(state, itermax, verbose=False, stats=stats)),
+        ('smart_ismcts', lambda state, rng, stats: Smart_ISMCTS(rng=rng).get_move(state, itermax, stats=stats)),
+        ('uct', lambda state, rng, stats: Determinized_UCT(rng=rng).get_move(state, itermax, verbose=False,
+                                                                             stats=stats)),
+        ('minimax', lambda state, rng, stats: Minimax.get_move(state, determinizations=determinizations, rng=rng,
+                                                               stats=stats)),
+    ]
+
+    results = {}
+    for name, search in searches:
+        rng = random.Random(seed)
+        stats = SearchStats()
+        for state in states:
+            search(state, rng, stats)
+        results[name] = stats.to_dict()
+    return results
+
+
+def operation_times(states, repeat=100, seed=0):
+    """
+    :return: mean time in microseconds of clone, clone_and_randomize and do_move on the states
+    """
+    rng = random.Random(seed)
+    times = defaultdict(float)
+    for state in states:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            state.clone(rng=rng)
+            times['clone'] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            determinization = state.clone_and_randomize(rng=rng)
+            times['clone_and_randomize'] += time.perf_counter() - start
+
+            move = rng.choice(determinization.get_moves())
+            start = time.perf_counter()
+            determinization.do_move(move)
+            times['do_move'] += time.perf_counter() - start
+
+    return {operation: seconds * 1e6 / (len(states) * repeat) for operation, seconds in times.items()}
+
+
+def head_to_head(specs, decks, games, seed=0):
+    """
+    Play seeded games between agents, see tournament.play_game
+    :return: summary with win rates and their confidence intervals
+    """
+    results = []
+    for index in range(games):
+        winner, rounds = play_game(specs, decks, seed + index)
+        results.append(dict(game=index, winner=winner, rounds=rounds))
+    return summarize(specs, results)
+
+
+def run_benchmarks(decks, states=20, itermax=1000, determinizations=50, repeat=100, matches=(), games=20, seed=0):
+    """
+    :param matches: list of agent specs of every head-to-head match
+    :return: dict with parameters and results of the benchmarks
+    """
+    corpus = build_corpus(decks, states, seed)
+    return dict(
+        parameters=dict(states=states, itermax=itermax, determinizations=determinizations, repeat=repeat,
+                        games=games, seed=seed),
+        throughput=search_throughput(corpus, itermax, determinizations, seed),
+        operations=operation_times(corpus, repeat, seed),
+        matches=[head_to_head(specs, decks, games, seed) for specs in matches],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search algorithms")
+    parser.add_argument('--states', type=int, default=20, help="size of the corpus of mid-round states")
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--determinizations', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=100, help="repetitions of every timed operation")
+    parser.add_argument('--match', action='append', nargs='+', default=[],
+                        help="agent specs of a head-to-head match, e.g. --match smart_ismcts:500 minimax")
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--decks', default='decks.txt')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--tree-parallel', action='store_true', help="compare tree-parallel and serial ISMCTS")
+    args = parser.parse_args()
+
+    decks = load_decks(args.decks)
+    if args.tree_parallel:
+        compare_tree_parallel(decks)
+        return
+
+    results = run_benchmarks(decks, args.states, args.iterations, args.determinizations, args.repeat, args.match,
+                             args.games, args.seed)
+    with open(args.output, 'w') as out:
+        json.dump(results, out, indent=2, sort_keys=True)
+
+    for name, stats in sorted(results['throughput'].items()):
+        print("{}: {:.0f} iterations/sec".format(name, stats['iterations_per_second']))
+    for operation, microseconds in sorted(results['operations'].items()):
+        print("{}: {:.1f} us".format(operation, microseconds))
+    for summary in results['matches']:
+        print(", ".join("{agent}: {win_rate:.3f}".format(**agent) for agent in summary['agents']))
+
+
+if __name__ == "__main__":
+    main()
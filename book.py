@@ -0,0 +1,207 @@
+"""
+Opening book of Smart ISMCTS.
+The first decision of a round is made from an information set that depends only on the number of players,
+the two cards in hand and, for the second player of a two player game, the card played before if it revealed
+nothing else (Maid or Countess). Run `python3 book.py --iterations 100000` to search every such opening deeply,
+root statistic of the searches is written to book.bin and ISMCTS(book=open_book()) plays openings from it.
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+from multiprocessing import Pool
+
+from cardclasses import cards_by_id, Maid, Countess
+from game import LoveLetterState
+from ismcts import Smart_ISMCTS, children_statistic
+from knowledge import remaining_cards
+
+MAGIC = b'LLOB'
+VERSION = 1
+# magic, version and number of records
+HEADER = struct.Struct('<4sHI')
+# number of players, lower and greater card in hand, previous card or 0 for the first player,
+# then move, wins, visits and availability count of both root children, move is 0 if there is a single child
+RECORD = struct.Struct('<4B' + 'B3I' * 2)
+KEY = struct.Struct('<4B')
+
+MAID, COUNTESS = Maid().id, Countess().id
+# cards which tell nothing but themselves when played as the first move
+SILENT_CARDS = (MAID, COUNTESS)
+
+
+def opening_key(snapshot):
+    """
+    :param snapshot: CompactState
+    :return: key of the opening in the book, None if the state is not an opening
+    """
+    n = len(snapshot.uids)
+    if snapshot.lost or snapshot.round_over or len(snapshot.trick) > 1 or any(snapshot.seen) or any(snapshot.wrong):
+        return None
+
+    previous, defence = 0, 0
+    if snapshot.trick:
+        seat, previous = snapshot.trick[0]
+        if n != 2 or previous not in SILENT_CARDS:
+            return None
+        defence = 1 << seat if previous == MAID else 0
+
+    # nothing but the previous card is used
+    used = tuple(int(previous and card_id == previous) for card_id in range(len(cards_by_id)))
+    if snapshot.defence != defence or snapshot.used != used:
+        return None
+
+    low, high = sorted(snapshot.hands[snapshot.to_move])
+    return n, low, high, previous
+
+
+def opening_keys(players=(2, 3, 4)):
+    """
+    :return: keys of every opening
+    """
+    keys = []
+    for n in players:
+        for previous in (0,) + (SILENT_CARDS if n == 2 else ()):
+            for low in range(1, len(cards_by_id)):
+                for high in range(low, len(cards_by_id)):
+                    known = [0] * len(cards_by_id)
+                    for card_id in (low, high, previous):
+                        known[card_id] += 1
+                    if min(remaining_cards(tuple(known))) >= 0:
+                        keys.append((n, low, high, previous))
+    return keys
+
+
+def opening_state(key, rng=random):
+    """
+    Deal a round with the opening of the key, cards unknown to the player to move are shuffled
+    :param rng: random stream of the state
+    :return: LoveLetterState
+    """
+    n, low, high, previous = key
+    known = [0] * len(cards_by_id)
+    for card_id in (low, high, previous):
+        known[card_id] += 1
+    rest = [card for card, counter in zip(cards_by_id, remaining_cards(tuple(known))) for _ in range(counter)]
+    rng.shuffle(rest)
+
+    hand = [cards_by_id[low], cards_by_id[high]]
+    if previous:
+        # out card, two players take a card, the first player takes a card and plays the previous one
+        dealt = [rest[0], cards_by_id[previous], hand[0], rest[1], hand[1]] + rest[2:]
+    else:
+        dealt = [rest[0], hand[0]] + rest[1:n] + [hand[1]] + rest[n:]
+
+    state = LoveLetterState(n, [dealt[::-1]], rng)
+    state.start_new_round()
+    if previous:
+        state.do_move(cards_by_id[previous], vanilla=False)
+    return state
+
+
+class OpeningBook(object):
+    """
+    Read only book file mapped to memory, records are sorted by key and looked up with binary search
+    """
+
+    def __init__(self, path='book.bin'):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not an opening book of version {}".format(path, VERSION))
+
+    def lookup(self, snapshot):
+        """
+        :param snapshot: CompactState
+        :return: list of move, wins, visits and availability count of root children, None if there is no opening
+        """
+        key = opening_key(snapshot)
+        if key is None:
+            return None
+
+        key = KEY.pack(*key)
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            if self.data[offset:offset + KEY.size] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        offset = HEADER.size + low * RECORD.size
+        if low == self.size or self.data[offset:offset + KEY.size] != key:
+            return None
+        values = RECORD.unpack_from(self.data, offset)[KEY.size:]
+        return [(cards_by_id[values[index]],) + values[index + 1:index + 4] for index in (0, 4) if values[index]]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.size
+
+
+def open_book(path='book.bin'):
+    """
+    :return: OpeningBook, None if the file doesn't exist
+    """
+    return OpeningBook(path) if os.path.exists(path) else None
+
+
+def write_book(path, entries):
+    """
+    :param entries: dict of root children statistic as returned by ismcts.children_statistic by opening key
+    """
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for key in sorted(entries):
+            values = []
+            for move, player, wins, visits, avails in entries[key][:2]:
+                values.extend((move.id, wins, visits, avails))
+            values.extend([0] * (8 - len(values)))
+            out.write(RECORD.pack(*(key + tuple(values))))
+
+
+def _search_opening(job):
+    key, iterations, seed = job
+    rng = random.Random(seed)
+    state = opening_state(key, rng)
+    rootnode = Smart_ISMCTS(rng=rng).search(state.compact(), iterations, vanilla=False)
+    return key, children_statistic(rootnode)
+
+
+def build_book(path='book.bin', players=(2, 3, 4), iterations=100000, processes=None, seed=0):
+    """
+    Search every opening in a process pool and write the book
+    :param iterations: number of ISMCTS iterations per opening
+    :param processes: size of the process pool, number of CPUs by default
+    :return: number of openings in the book
+    """
+    jobs = [(key, iterations, seed + index) for index, key in enumerate(opening_keys(players))]
+    with Pool(processes) as pool:
+        entries = dict(pool.imap_unordered(_search_opening, jobs))
+    write_book(path, entries)
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build opening book")
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--players', type=int, nargs='+', default=[2, 3, 4])
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='book.bin')
+    args = parser.parse_args()
+
+    size = build_book(args.output, args.players, args.iterations, args.processes, args.seed)
+    print("{} openings written to {}".format(size, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,61 @@
 # -*- coding: utf-8 -*-
 
-import random
-
 
 class Card:
+    """
+    Base class of the card types. Every card type has a single shared instance (see card_dict),
+    so calling Princess() returns the same object each time. Cards are compared and hashed by id.
+    """
+    id = None
     value = None
     name = None
     max_count = 0
 
+    def __new__(cls):
+        instance = cls.__dict__.get('instance')
+        if instance is None:
+            instance = super(Card, cls).__new__(cls)
+            cls.instance = instance
+        return instance
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return type(self), ()
+
     def __eq__(self, other):
-        return self.name == getattr(other, 'name', None)
+        return self.id == getattr(other, 'id', None)
+
+    def __ne__(self, other):
+        return not self == other
 
     def __le__(self, other):
-        return self.value <= other.value
+        return self.id <= other.id
 
     def __ge__(self, other):
-        return self.value >= other.value
+        return self.id >= other.id
 
     def __lt__(self, other):
-        return self.value < other.value
+        return self.id < other.id
 
     def __gt__(self, other):
-        return self.value > other.value
+        return self.id > other.id
 
     def __str__(self):
         return str(self.name)
 
     def __hash__(self):
-        return hash(str(self.name))
+        return self.id
 
 
 class Princess(Card):
     name = 'Princess'
     path = 'static/princess.gif'
-    value = 8
+    id = value = 8
     max_count = 1
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -49,7 +71,7 @@ class Princess(Card):
 class Countess(Card):
     name = 'Countess'
     path = 'static/countess.gif'
-    value = 7
+    id = value = 7
     max_count = 1
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -64,7 +86,7 @@ class Countess(Card):
 class King(Card):
     name = 'King'
     path = 'static/king.gif'
-    value = 6
+    id = value = 6
     max_count = 1
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -89,9 +111,11 @@ class King(Card):
 
             for player in game.user_ctl.users:
                 if card1 in game.seen_cards[player][current_player] and not player.lost:
+                    game.save_list(game.seen_cards[player][current_player])
                     game.seen_cards[player][current_player].remove(card1)
 
                 if card2 in game.seen_cards[player][victim] and not player.lost:
+                    game.save_list(game.seen_cards[player][victim])
                     game.seen_cards[player][victim].remove(card2)
 
             game.add_seen_card(victim, current_player, card2)
@@ -110,7 +134,7 @@ class King(Card):
 class Prince(Card):
     name = 'Prince'
     path = 'static/prince.gif'
-    value = 5
+    id = value = 5
     max_count = 2
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -121,10 +145,11 @@ class Prince(Card):
 
             for player in game.user_ctl.users:
                 if card in game.seen_cards[player][victim]:
+                    game.save_list(game.seen_cards[player][victim])
                     game.seen_cards[player][victim].remove(card)
 
             assert (len(game.playerHands[victim]) == 0)
-            game.used_cards[card] += 1
+            game.use_card(card)
 
             assert game.used_cards[card] <= card.max_count
 
@@ -154,7 +179,7 @@ class Prince(Card):
             card = game.playerHands[current_player].pop()
 
             assert len(game.playerHands[current_player]) == 0
-            game.used_cards[card] += 1
+            game.use_card(card)
 
             assert game.used_cards[card] <= card.max_count
 
@@ -182,7 +207,7 @@ class Prince(Card):
 class Maid(Card):
     name = 'Maid'
     path = 'static/maid.gif'
-    value = 4
+    id = value = 4
     max_count = 2
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -199,7 +224,7 @@ class Maid(Card):
 class Baron(Card):
     name = 'Baron'
     path = 'static/baron.gif'
-    value = 3
+    id = value = 3
     max_count = 2
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -216,7 +241,7 @@ class Baron(Card):
 
             if game.playerHands[owner][0] > game.playerHands[victim][0]:
                 # current player kicks out victim
-                game.used_cards[game.playerHands[victim][0]] += 1
+                game.use_card(game.playerHands[victim][0])
 
                 assert game.used_cards[game.playerHands[victim][0]] <= game.playerHands[victim][0].max_count
                 game.user_ctl.kill(victim)
@@ -229,7 +254,7 @@ class Baron(Card):
                                                                                   game.playerHands[owner][0]))
             elif game.playerHands[owner][0] < game.playerHands[victim][0]:
                 # victim kicks out current player
-                game.used_cards[game.playerHands[owner][0]] += 1
+                game.use_card(game.playerHands[owner][0])
 
                 assert game.used_cards[game.playerHands[owner][0]] <= game.playerHands[owner][0].max_count
 
@@ -255,7 +280,7 @@ class Baron(Card):
 class Priest(Card):
     name = 'Priest'
     path = 'static/priest.gif'
-    value = 2
+    id = value = 2
     max_count = 2
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -281,7 +306,7 @@ class Priest(Card):
 class Guard(Card):
     name = 'Guard'
     path = 'static/guard.gif'
-    value = 1
+    id = value = 1
     max_count = 5
 
     def activate(self, game, victim, verbose, **kwargs):
@@ -293,59 +318,31 @@ class Guard(Card):
                 messages.append("{} plays Guard to itself".format(game.playerToMove))
                 print("{} plays Guard to itself".format(game.playerToMove))
         else:
-            card_count = {
-                Princess(): 1,
-                Countess(): 1,
-                King(): 1,
-                Prince(): 2,
-                Maid(): 2,
-                Baron(): 2,
-                Priest(): 2,
-            }
-
             if not victim_card:
-                # remove already played cards from candidates
-                for card, counter in game.used_cards.items():
-                    # ignore guard because it cannot be guessed
-                    if card.name != 'Guard':
-                        card_count[card] -= counter
-                        assert card_count[card] >= 0
-
-                for card in game.playerHands[game.playerToMove]:
-                    if card.name != 'Guard':
-                        card_count[card] -= 1
-                        assert card_count[card] >= 0
+                from knowledge import known_cards, remaining_cards, guess_candidates, most_probable_guesses
 
+                # guard cannot be guessed, already played cards and cards in hand are not candidates
+                hand = game.playerHands[game.playerToMove]
                 if kwargs.get('vanilla', False):
-                    possible_cards = []
-
-                    for card in card_count:
-                        for _ in range(card_count[card]):
-                            possible_cards.append(card)
-
-                    victim_card = random.choice(possible_cards)
+                    victim_card = game.rng.choice(guess_candidates(known_cards(game.used_cards, hand)))
                 else:
                     # ignore cards that were guessed incorrectly
-                    for card in game.wrong_guesses[victim]:
-                        if card.name != 'Guard':
-                            card_count[card] -= 1
+                    known = known_cards(game.used_cards, hand, game.wrong_guesses[victim])
+                    card_count = remaining_cards(known)
 
                     if game.currentTrick and game.currentTrick[-1][1].name == "Countess":
-                        if card_count[Prince()] > 0:
+                        if card_count[Prince.id] > 0:
                             victim_card = Prince()
-                        elif card_count[King()] > 0:
+                        elif card_count[King.id] > 0:
                             victim_card = King()
 
-                    available_cards = sorted([(counter, card) for card, counter in card_count.items()], reverse=True)
-                    most_probable_cards = [card for counter, card in available_cards if
-                                           counter == available_cards[0][0]]
                     if not victim_card:
-                        victim_card = random.choice(most_probable_cards)
+                        victim_card = game.rng.choice(most_probable_guesses(known))
 
             assert victim_card
 
             if victim_card in game.playerHands[victim]:
-                game.used_cards[victim_card] += 1
+                game.use_card(victim_card)
                 assert game.used_cards[victim_card] <= victim_card.max_count
                 game.user_ctl.kill(victim)
                 if verbose:
@@ -353,6 +350,7 @@ class Guard(Card):
                         "{} kicks out {} via Guard with guess {}".format(game.playerToMove, victim, victim_card))
                     print("{} kicks out {} via Guard with guess {}".format(game.playerToMove, victim, victim_card))
             else:
+                game.save_list(game.wrong_guesses[victim])
                 game.wrong_guesses[victim].append(victim_card)
                 if verbose:
                     messages.append(
@@ -363,13 +361,7 @@ class Guard(Card):
         return messages
 
 
-card_dict = {
-    'Princess': Princess(),
-    'Countess': Countess(),
-    'King': King(),
-    'Priest': Priest(),
-    'Maid': Maid(),
-    'Baron': Baron(),
-    'Guard': Guard(),
-    'Prince': Prince(),
-}
+# registry of card types, ids are equal to card values
+card_dict = {card.name: card for card in (Princess(), Countess(), King(), Prince(), Maid(), Baron(), Priest(), Guard())}
+
+cards_by_id = [None] + sorted(card_dict.values())
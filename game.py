@@ -2,23 +2,55 @@
 
 import random
 from collections import defaultdict
-from copy import deepcopy, copy
+from copy import copy
 
-from cardclasses import Guard, Priest, Baron, Maid, Prince, King, Countess, Princess, card_dict, Card
+from cardclasses import Guard, Priest, Baron, Maid, Prince, King, Countess, Princess, card_dict, cards_by_id, Card
+from knowledge import remaining_cards
 from player import Player, PlayerCtl
 from playing_mode import PlayingMode
 from strategy import clean_cards
 from utils import TranspositionTable
 
 
+class MoveRecord(object):
+    """
+     Changes made by a single move, filled in by LoveLetterState.make_move and reverted by LoveLetterState.undo_move.
+     Hands, seen cards and wrong guesses are saved before they change, counters keep their previous values.
+    """
+
+    __slots__ = ('player_to_move', 'next_player_index', 'flags', 'deck_size', 'deck_tail', 'out_card', 'round_over',
+                 'game_over', 'trick_size', 'lists', 'counters')
+
+    def __init__(self, state):
+        self.player_to_move = state.playerToMove
+        self.next_player_index = state.user_ctl.next_player_index
+        self.flags = [(user.lost, user.defence, user.won_round) for user in state.user_ctl.users]
+        self.deck_size = len(state.deck)
+        # no more than two cards are drawn during a move
+        self.deck_tail = state.deck[-2:]
+        self.out_card = getattr(state, 'out_card', None)
+        self.round_over = state.round_over
+        self.game_over = state.game_over
+        self.trick_size = len(state.currentTrick)
+        self.lists = [(state.playerHands[user], state.playerHands[user][:]) for user in state.user_ctl.users]
+        self.counters = []
+
+    def save_list(self, cards):
+        self.lists.append((cards, cards[:]))
+
+    def save_counter(self, counter, key):
+        self.counters.append((counter, key, counter.get(key)))
+
+
 class LoveLetterState:
     """
      A state of the game love letter.
     """
 
-    def __init__(self, n, decks=None):
+    def __init__(self, n, decks=None, rng=None):
         """ Initialise the game state which are constant during the game. 
             n is the number of players (from 2 to 4).
+            rng is the random stream of the game (see rng module), the global random module by default.
         """
         self.numberOfPlayers = n
         self.used_cards = defaultdict(int)  # Stores the cards that have been played already in this round
@@ -30,88 +62,51 @@ class LoveLetterState:
         self.real_players = []
         self.decks = decks
         self.tricks_taken_limit = 7
+        self.undo_record = None  # MoveRecord of the move being made by make_move
+        self.rng = rng or random
 
     def get_winner(self):
         winners = [player for player in self.user_ctl.users if player.won_round]
         assert len(winners) == 1
         return winners[0]
 
-    def clone(self, **kwargs):
-        """ Create a deep clone of this game state.
+    def compact(self):
+        """ Pack this game state into a CompactState snapshot.
         """
-        st = LoveLetterState(self.numberOfPlayers)
-        st.round = self.round
-        st.playerHands = defaultdict(list)
-        st.used_cards = deepcopy(self.used_cards)
-        st.currentTrick = deepcopy(self.currentTrick)
-        st.tricksTaken = deepcopy(self.tricksTaken)
-        st.seen_cards = deepcopy(self.seen_cards)
-        st.round_over = self.round_over
-        st.wrong_guesses = deepcopy(self.wrong_guesses)
-        st.game_over = self.game_over
-        st.deck = []
-
-        card_count = {
-            Princess(): 1,
-            Countess(): 1,
-            King(): 1,
-            Prince(): 2,
-            Maid(): 2,
-            Baron(): 2,
-            Priest(): 2,
-            Guard(): 5,
-        }
-
-        st.tricks_taken_limit = self.tricks_taken_limit
-
-        for card, counter in st.used_cards.items():
-            card_count[card] -= counter
-            assert card_count[card] >= 0
+        return CompactState.pack(self)
 
-        for card, counter in card_count.items():
-            if counter > 0:
-                st.deck.extend([card] * counter)
-
-        random.shuffle(st.deck)
-        st.user_ctl = self.user_ctl.clone()
-        st.real_players = deepcopy(st.real_players)
-        st.playerToMove = st.user_ctl.users[st.user_ctl.users.index(self.playerToMove)]
-
-        return st
+    def clone(self, **kwargs):
+        """ Create a clone of this game state. Hands are left empty and the deck holds every unused card.
+            The clone takes random numbers from rng argument, from the stream of this state by default.
+        """
+        kwargs.setdefault('rng', self.rng)
+        return self.compact().clone(**kwargs)
 
     def clone_and_randomize(self, **kwargs):
         """ Create a deep clone of this game state, randomizing any information not visible to the specified observer player.
+            The clone takes random numbers from rng argument, from the stream of this state by default.
         """
-        st = self.clone()
         assert len(self.playerHands[self.playerToMove]) == 2
-        # assign same card for current user
-        st.playerHands[st.playerToMove] = deepcopy(self.playerHands[self.playerToMove])
-        # remove current player's cards from deck
-        for card in self.playerHands[self.playerToMove]:
-            st.deck.remove(card)
-
-        # assign random cards for other users
-        for user in st.user_ctl.users:
-            if user != st.playerToMove and not user.lost:
-                if not kwargs.get('vanilla', False) and st.seen_cards[st.playerToMove][user]:
-                    taken_card = random.choice(st.seen_cards[st.playerToMove][user])
-                    if taken_card in st.deck:
-                        st.playerHands[user].append(taken_card)
-                        st.deck.remove(taken_card)
-                    else:
-                        del st.seen_cards[st.playerToMove][user][:]
+        kwargs.setdefault('rng', self.rng)
+        return self.compact().clone_and_randomize(**kwargs)
 
-        for user in st.user_ctl.users:
-            if user != st.playerToMove and not user.lost and not st.playerHands[user]:
-                user.take_card(st)
+    def save_list(self, cards):
+        """ Remember cards list before changing it when the move is made by make_move
+        """
+        if self.undo_record is not None:
+            self.undo_record.save_list(cards)
 
-        # select outcard
-        st.out_card = st.deck.pop()
+    def save_counter(self, counter, key):
+        if self.undo_record is not None:
+            self.undo_record.save_counter(counter, key)
 
-        return st
+    def use_card(self, card):
+        self.save_counter(self.used_cards, card)
+        self.used_cards[card] += 1
 
     def add_seen_card(self, _from, to, card):
         if not self.seen_cards[_from][to] or card not in self.seen_cards[_from][to]:
+            self.save_list(self.seen_cards[_from][to])
             del self.seen_cards[_from][to][:]
             self.seen_cards[_from][to].append(card)
 
@@ -160,11 +155,11 @@ class LoveLetterState:
 
         if not hasattr(self, "user_ctl"):
             self.user_ctl = PlayerCtl(self.numberOfPlayers)
-            self.user_ctl.shuffle()
+            self.user_ctl.shuffle(self.rng)
         else:
             self.user_ctl.reset()
 
-        self.deck = copy(random.choice(self.decks))
+        self.deck = copy(self.rng.choice(self.decks))
         # remove one card from deck and remember it
         self.out_card = self.deck.pop()
         self.playerHands = {user: [] for user in self.user_ctl.users}
@@ -214,7 +209,8 @@ class LoveLetterState:
             self.playerToMove.defence = False
 
         old_wrong_guesses = self.wrong_guesses[self.playerToMove]
-        clean_cards(move, self.wrong_guesses[self.playerToMove], self.seen_cards, self.playerToMove)
+        clean_cards(move, self.wrong_guesses[self.playerToMove], self.seen_cards, self.playerToMove,
+                    record=self.undo_record)
         if move not in old_wrong_guesses:
             assert not old_wrong_guesses
 
@@ -222,7 +218,7 @@ class LoveLetterState:
                         if not player.defence and self.playerToMove != player and not player.lost]
 
         if not victim:
-            victim = random.choice(left_players) if left_players else None
+            victim = self.rng.choice(left_players) if left_players else None
             kwargs['victim'] = victim
 
         if victim:
@@ -232,11 +228,11 @@ class LoveLetterState:
         self.playerHands[self.playerToMove].remove(move)
         assert len(self.playerHands[self.playerToMove]) == 1
 
-        self.used_cards[move] += 1
+        self.use_card(move)
         # code to refactor
         if move.name == "Prince" and not victim:
             clean_cards(self.playerHands[self.playerToMove][0], self.wrong_guesses[self.playerToMove], self.seen_cards,
-                        self.playerToMove)
+                        self.playerToMove, record=self.undo_record)
         messages.extend(move.activate(self, **kwargs))
 
         # Store the played card in the current trick
@@ -245,6 +241,7 @@ class LoveLetterState:
         # If only one player left
         if self.user_ctl.players_left_number() == 1:
             winner = self.user_ctl.get_left_player()
+            self.save_counter(self.tricksTaken, winner)
             self.tricksTaken[winner] += 1
             winner.won_round = True
 
@@ -277,6 +274,7 @@ class LoveLetterState:
 
             winner = cards[0][0]
             winner.won_round = True
+            self.save_counter(self.tricksTaken, winner)
             self.tricksTaken[winner] += 1
             if self.tricksTaken[winner] == self.tricks_taken_limit:
                 self.game_over = True
@@ -296,6 +294,46 @@ class LoveLetterState:
 
         return messages
 
+    def make_move(self, move, **kwargs):
+        """
+        Apply move like do_move does, recording every change of the state
+        :param move: move to make
+        :return: MoveRecord to pass to undo_move
+        """
+        assert not kwargs.get('global_game', False)
+        record = self.undo_record = MoveRecord(self)
+        try:
+            self.do_move(move, **kwargs)
+        finally:
+            self.undo_record = None
+        return record
+
+    def undo_move(self, record):
+        """
+        Restore the state as it was before the move recorded by make_move. Moves must be undone in reverse order.
+        :param record: MoveRecord returned by make_move
+        """
+        for counter, key, value in reversed(record.counters):
+            if value is None:
+                del counter[key]
+            else:
+                counter[key] = value
+
+        for cards, contents in reversed(record.lists):
+            cards[:] = contents
+
+        for user, (lost, defence, won_round) in zip(self.user_ctl.users, record.flags):
+            user.lost, user.defence, user.won_round = lost, defence, won_round
+
+        self.deck[record.deck_size - len(record.deck_tail):] = record.deck_tail
+        self.out_card = record.out_card
+        del self.currentTrick[record.trick_size:]
+
+        self.playerToMove = record.player_to_move
+        self.user_ctl.next_player_index = record.next_player_index
+        self.round_over = record.round_over
+        self.game_over = record.game_over
+
     def __repr__(self):
         """ Return a human-readable representation of the state
         """
@@ -310,66 +348,232 @@ class LoveLetterState:
         return result
 
 
-def compare(decks):
-    table = TranspositionTable()
-    with open('ismcts_vs_ismcts__200.txt', 'w') as out:
+class CompactState(object):
+    """
+     Flat snapshot of a LoveLetterState made of small ints.
+     Cards are stored by id, players by their seat in user_ctl.users, seen cards and wrong guesses as bitmasks of
+     card ids. All fields are immutable, so copying a snapshot never recurses into the game objects.
+    """
 
-        for iterations in (50, 100, 200, 500, 1000, 2000, 4000):
-            winner_counter = defaultdict(int)
-            game_number = 1
+    __slots__ = ('numberOfPlayers', 'round', 'round_over', 'game_over', 'tricks_taken_limit', 'uids', 'algorithms',
+                 'lost', 'defence', 'won', 'tricks', 'next_player_index', 'to_move', 'used', 'hands', 'deck',
+                 'out_card', 'trick', 'seen', 'wrong', 'real')
+
+    @staticmethod
+    def pack(state):
+        users = state.user_ctl.users
+        n = len(users)
+        seats = {user: seat for seat, user in enumerate(users)}
+
+        st = CompactState()
+        st.numberOfPlayers = state.numberOfPlayers
+        st.round = state.round
+        st.round_over = state.round_over
+        st.game_over = state.game_over
+        st.tricks_taken_limit = state.tricks_taken_limit
+        st.uids = tuple(user.uid for user in users)
+        st.algorithms = tuple(user.algorithm for user in users)
+        st.lost = st.defence = st.won = 0
+        for seat, user in enumerate(users):
+            st.lost |= user.lost << seat
+            st.defence |= user.defence << seat
+            st.won |= user.won_round << seat
+        st.tricks = tuple(state.tricksTaken.get(user, 0) for user in users)
+        st.next_player_index = state.user_ctl.next_player_index
+        st.to_move = seats[state.playerToMove]
+
+        used = [0] * len(cards_by_id)
+        for card, counter in state.used_cards.items():
+            used[card.id] += counter
+        st.used = tuple(used)
+
+        st.hands = tuple(tuple(card.id for card in state.playerHands.get(user, ())) for user in users)
+        st.deck = tuple(card.id for card in state.deck)
+        out_card = getattr(state, 'out_card', None)
+        st.out_card = out_card.id if out_card else 0
+        st.trick = tuple((seats[player], card.id) for player, card in state.currentTrick)
+
+        seen = [0] * (n * n)
+        for observer, targets in state.seen_cards.items():
+            for target, cards in targets.items():
+                for card in cards:
+                    seen[seats[observer] * n + seats[target]] |= 1 << card.id
+        st.seen = tuple(seen)
+
+        wrong = [0] * n
+        for player, cards in state.wrong_guesses.items():
+            for card in cards:
+                wrong[seats[player]] |= 1 << card.id
+        st.wrong = tuple(wrong)
+
+        st.real = tuple(seats[player] for player in state.real_players)
+        return st
 
-            for plays in range(game_number):
-                state = LoveLetterState(2, decks)
-                state.start_new_round()
-                mode = PlayingMode(state, "compare_bots", show_logs=False)
+    def copy(self):
+        st = CompactState()
+        for name in CompactState.__slots__:
+            setattr(st, name, getattr(self, name))
+        return st
 
-                while not state.game_over:
-                    try:
-                        assert len(state.playerHands[state.playerToMove]) == 2
-                    except:
-                        import pdb
-                        pdb.set_trace()
-                    move, victim, guess = mode.get_move(iterations)
-                    # table.write(state, move, victim, guess)
-                    state.do_move(move, verbose=False, global_game=True, victim=victim, guess=guess,
-                                  real_player=state.playerToMove == mode.real_player, vanilla=False)
+    def remaining(self):
+        """
+        :return: number of unused cards of every id
+        """
+        return remaining_cards(self.used)
 
-                # determine a winner
-                for player in state.user_ctl.users:
-                    if state.tricksTaken[player] == state.tricks_taken_limit:
-                        # print("Player " + str(player) + " wins the game!")
-                        winner_counter[player.algorithm] += 1
+    def _unpack(self):
+        """
+        Restore everything but hands, deck and out card
+        :return: new LoveLetterState
+        """
+        n = len(self.uids)
+        st = LoveLetterState(self.numberOfPlayers)
+        st.round = self.round
+        st.round_over = self.round_over
+        st.game_over = self.game_over
+        st.tricks_taken_limit = self.tricks_taken_limit
+
+        st.user_ctl = PlayerCtl(n, skip=True)
+        st.user_ctl.users = users = [Player(uid, bool(self.lost >> seat & 1), bool(self.defence >> seat & 1), algorithm)
+                                     for seat, (uid, algorithm) in enumerate(zip(self.uids, self.algorithms))]
+        for seat, user in enumerate(users):
+            user.won_round = bool(self.won >> seat & 1)
+            if self.tricks[seat]:
+                st.tricksTaken[user] = self.tricks[seat]
+        st.user_ctl.next_player_index = self.next_player_index
+        st.playerToMove = users[self.to_move]
+
+        for card_id, counter in enumerate(self.used):
+            if counter:
+                st.used_cards[cards_by_id[card_id]] = counter
+        st.currentTrick = [(users[seat], cards_by_id[card_id]) for seat, card_id in self.trick]
+
+        for index, mask in enumerate(self.seen):
+            if mask:
+                st.seen_cards[users[index // n]][users[index % n]] = [card for card in cards_by_id[1:]
+                                                                      if mask >> card.id & 1]
+        for seat, mask in enumerate(self.wrong):
+            if mask:
+                st.wrong_guesses[users[seat]] = [card for card in cards_by_id[1:] if mask >> card.id & 1]
+
+        st.playerHands = defaultdict(list)
+        return st
+
+    def to_state(self):
+        """
+        :return: LoveLetterState equal to the packed one, including hands, deck order and out card
+        """
+        st = self._unpack()
+        users = st.user_ctl.users
+        for seat, hand in enumerate(self.hands):
+            st.playerHands[users[seat]] = [cards_by_id[card_id] for card_id in hand]
+        st.deck = [cards_by_id[card_id] for card_id in self.deck]
+        st.out_card = cards_by_id[self.out_card]
+        st.real_players = [users[seat] for seat in self.real]
+        return st
 
-            assert (sum(winner_counter.values()) == game_number)
+    def clone(self, **kwargs):
+        """ Same as LoveLetterState.clone: hands are empty and the deck is shuffled from every unused card
+            with rng argument, the global random module by default
+        """
+        st = self._unpack()
+        st.rng = kwargs.get('rng') or random
+        st.deck = [card for card, counter in zip(cards_by_id, self.remaining()) for _ in range(counter)]
+        st.rng.shuffle(st.deck)
+        return st
 
-            out.write("{} iterations\n".format(iterations))
+    def clone_and_randomize(self, **kwargs):
+        """ Same as LoveLetterState.clone_and_randomize, but built straight from the packed card counts.
+            Hidden cards are dealt with rng argument, the global random module by default.
+        """
+        hand = self.hands[self.to_move]
+        assert len(hand) == 2
 
-            for algorithm, won_count in winner_counter.items():
-                out.write("{} - {}\n".format(algorithm, won_count))
-            out.write("\n")
+        n = len(self.uids)
+        st = self._unpack()
+        rng = st.rng = kwargs.get('rng') or random
+        users = st.user_ctl.users
+        # assign same card for current user
+        known = list(self.used)
+        for card_id in hand:
+            known[card_id] += 1
+        counts = list(remaining_cards(tuple(known)))
+        assert min(counts) >= 0
+        st.playerHands[st.playerToMove] = [cards_by_id[card_id] for card_id in hand]
+
+        # assign cards seen by current user
+        if not kwargs.get('vanilla', False):
+            for seat, user in enumerate(users):
+                mask = self.seen[self.to_move * n + seat]
+                if seat != self.to_move and not user.lost and mask:
+                    taken_card = rng.choice([card for card in cards_by_id[1:] if mask >> card.id & 1])
+                    if counts[taken_card.id] > 0:
+                        counts[taken_card.id] -= 1
+                        st.playerHands[user].append(taken_card)
+                    else:
+                        del st.seen_cards[st.playerToMove][user][:]
+
+        st.deck = [card for card, counter in zip(cards_by_id, counts) for _ in range(counter)]
+        rng.shuffle(st.deck)
 
-            print("Iterations - {}".format(iterations, ))
-            print(winner_counter)
+        # assign random cards for other users
+        for user in users:
+            if user != st.playerToMove and not user.lost and not st.playerHands[user]:
+                user.take_card(st)
+
+        # select outcard
+        st.out_card = st.deck.pop()
+
+        return st
+
+    def __eq__(self, other):
+        return isinstance(other, CompactState) and \
+            all(getattr(self, name) == getattr(other, name) for name in CompactState.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def load_decks(path='decks.txt'):
+    """
+    :param path: file with a deck per line
+    :return: list of decks specified in advance
+    """
+    decks = []
+    with open(path) as f:
+        for line in f:
+            splitted = line.split()
+            decks.append([card_dict[card] for card in splitted])
+    return decks
+
+
+def compare(games=100):
+    """
+    Play Smart ISMCTS against Minimax on growing number of iterations, see tournament.py
+    """
+    # tournament module imports this one
+    from tournament import run_tournament
+
+    for iterations in (50, 100, 200, 500, 1000, 2000, 4000):
+        summary = run_tournament(["smart_ismcts:{}".format(iterations), "minimax"], games,
+                                 "smart_ismcts_vs_minimax_{}.jsonl".format(iterations))
+        print("Iterations - {}".format(iterations))
+        for agent in summary['agents']:
+            print("{agent}: {win_rate:.3f} [{ci95[0]:.3f}, {ci95[1]:.3f}]".format(**agent))
 
     print("Done")
-    # table.close()
 
 
 def play_game():
     """ 
     Play a sample game between 2-4 ISMCTS players.
     """
-    decks = []
-
     # use decks specified in advance
-    with open('decks.txt') as f:
-        for line in f:
-            splitted = line.split()
-            decks.append([card_dict[card] for card in splitted])
+    decks = load_decks()
     # state = LoveLetterState(2, decks)
     # state.start_new_round()
 
-    compare(decks)
+    compare()
 
     # mode = PlayingMode(state, "real_player")
     # while not state.game_over:
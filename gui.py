@@ -9,6 +9,8 @@ from cardclasses import card_dict
 from game import LoveLetterState
 from playing_mode import PlayingMode
 
+AI_MOVE_BUDGET = 2  # seconds the opponent may think on a move
+
 
 class Game(QThread):
     history_signal = pyqtSignal(str)
@@ -37,7 +39,7 @@ class Game(QThread):
         state = LoveLetterState(2, decks)
         state.start_new_round()
 
-        mode = PlayingMode(state, "real_player")
+        mode = PlayingMode(state, "real_player", budget=AI_MOVE_BUDGET)
         while not state.game_over:
             if state.playerToMove == state.real_players[0]:
                 self.show_turn.emit(True)
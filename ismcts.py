@@ -1,6 +1,13 @@
 import random
+from multiprocessing import Pool
+from threading import Lock, Thread
+from time import time
 
 from node import Node
+from rollout import simulate_batch
+from rng import split
+from selection import UCB1
+from stats import NULL_STATS
 from strategy import get_optimal_move, clean_cards, get_guess_card
 from rule_based import get_move
 from collections import defaultdict
@@ -9,6 +16,23 @@ from cardclasses import Princess, Guard, Priest, Countess, King, Prince, Card, B
 
 class ISMCTS(object):
 
+    def __init__(self, table=None, book=None, keep_trees=True, policy=None, rng=None):
+        """
+        :param table: TranspositionTable keeping statistic of root children between searches from the same
+                      information set, statistic is not kept if None
+        :param book: OpeningBook with statistic of root children for the first decisions of a round
+        :param keep_trees: keep the search tree of every player to continue it on his next move in the round
+        :param policy: selection policy from selection module, UCB1 by default
+        :param rng: random stream of the search (see rng module), the global random module by default
+        """
+        self.table = table
+        self.book = book
+        self.keep_trees = keep_trees
+        self.policy = policy or UCB1()
+        self.rng = rng or random
+        # game, round, trick and root node of the last search by uid of the player
+        self.trees = {}
+
     def check_countess(self, rootstate):
         # if hand is (King, Countess) or (Prince, Countess), play the Countess
         return Countess() in rootstate.playerHands[rootstate.playerToMove] and \
@@ -20,7 +44,13 @@ class ISMCTS(object):
                          state.wrong_guesses, state.user_ctl.users,
                          state.seen_cards, state.playerHands[state.playerToMove],
                          len(state.deck), real_players=state.real_players, random=kwargs.get('random', True),
-                         playerHands=state.playerHands)
+                         playerHands=state.playerHands, rng=state.rng)
+
+    def apply_move(self, state, move, **kwargs):
+        """
+        Make move on the state searched in the current iteration
+        """
+        state.do_move(move, **kwargs)
 
     def select(self, state, node, **kwargs):
         """
@@ -33,10 +63,10 @@ class ISMCTS(object):
             victim, guess = None, None
             # node is fully expanded and non-terminal
             available_moves = state.get_moves()
-            node = node.ucb_select_child(available_moves)
+            node = node.select_child(available_moves, self.policy)
             if node.move.name == "Guard" and kwargs.get('extra', False):
                 victim, guess = get_guess_card(state.user_ctl.users, state.playerToMove, state.seen_cards)
-            state.do_move(node.move, victim=victim, guess=guess, verbose=kwargs.get('verbose', False))
+            self.apply_move(state, node.move, victim=victim, guess=guess, verbose=kwargs.get('verbose', False))
         return node
 
     def expand(self, state, node, **kwargs):
@@ -52,8 +82,8 @@ class ISMCTS(object):
             # at expansion step algorithm chooses node randomly
             assert len(state.playerHands[state.playerToMove]) == 2
             move, victim, guess = self.get_move_by_policy(state, untried_moves)
-            node = node.add_child(move, state.playerToMove)  # add child and descend tree
-            state.do_move(move, victim=victim, guess=guess, verbose=kwargs.get('verbose', False))
+            node = node.add_child(move, state.playerToMove.uid)  # add child and descend tree
+            self.apply_move(state, move, victim=victim, guess=guess, verbose=kwargs.get('verbose', False))
 
         return node
 
@@ -66,49 +96,274 @@ class ISMCTS(object):
         while not state.round_over and state.get_moves():  # while state is non-terminal
             move, victim, guess = self.get_move_by_policy(state, state.get_moves())
             assert len(state.playerHands[state.playerToMove]) == 2
-            state.do_move(move, verbose=kwargs.get('verbose', False))
+            self.apply_move(state, move, verbose=kwargs.get('verbose', False))
 
-    def backpropagate(self, state, node):
+    def backpropagate(self, state, node, winner=None):
+        winner = winner or state.get_winner()
         while node:  # backpropagate from the expanded node and work back to the root node
-            node.update(state)
+            node.update(winner)
             node = node.parentNode
 
+    def reused_root(self, rootstate):
+        """ Find the node of the tree kept from the previous search of the player to move, which the moves
+            played since then lead to. The node is detached from its parent, so the rest of the tree is released.
+            Return None if the tree can't be reused.
+        """
+        game, round, trick, node = self.trees.pop(rootstate.playerToMove.uid, (None, None, None, None))
+        if game != id(rootstate) or round != rootstate.round or \
+                [(player.uid, card.id) for player, card in rootstate.currentTrick[:len(trick)]] != trick:
+            return None
+
+        for player, card in rootstate.currentTrick[len(trick):]:
+            node = node.get_child(card)
+            if not node or node.playerJustMoved != player.uid:
+                return None
+
+        node.parentNode = None
+        # moves with cards the player doesn't hold any more can't be selected
+        node.keep_children(rootstate.get_moves())
+        return node
+
     def select_final_move(self, rootnode, rootstate):
         final_move = max(rootnode.childNodes, key=lambda c: c.visits).move  # return the move that was most visited
         return final_move, None, None
 
-    def get_move(self, rootstate, itermax, verbose = True, **kwargs):
+    def search(self, snapshot, itermax, **kwargs):
+        """ Run itermax iterations on determinizations of the packed root state, or until the deadline passes.
+            If rootnode argument is given, the search continues the tree of that node.
+            If stats argument is given, time of every phase and rollout lengths are added to that SearchStats.
+            Return the root node of the search tree, the number of made iterations is kept in self.iterations.
+        """
+        rootnode = kwargs.pop('rootnode', None) or Node()
+        stats = kwargs.pop('stats', None) or NULL_STATS
+        self.iterations = 0
+        batch = kwargs.get('batch', 1)
+        while in_budget(self.iterations, itermax, kwargs.get('deadline')):
+            if batch > 1:
+                size = batch if itermax is None else min(batch, itermax - self.iterations)
+                self.iterations += size
+                start = stats.tick()
+                self.batch_iteration(snapshot, rootnode, size, **kwargs)
+                stats.record('batch', start)
+                continue
+
+            self.iterations += 1
+            node = rootnode
+            # determinize
+            start = stats.tick()
+            state = snapshot.clone_and_randomize(vanilla=kwargs.get('vanilla', True), rng=self.rng)
+            start = stats.record('determinize', start)
+            node = self.select(state, node)
+            start = stats.record('select', start)
+            node = self.expand(state, node)
+            start = stats.record('expand', start)
+            moves = len(state.currentTrick)
+            self.simulate(state)
+            stats.add_rollout(len(state.currentTrick) - moves)
+            start = stats.record('simulate', start)
+            self.backpropagate(state, node)
+            stats.record('backpropagate', start)
+        return rootnode
+
+    def batch_iteration(self, snapshot, rootnode, size, **kwargs):
+        """ Select and expand size leaves, play them out together with the random policy of rollout module
+            and backpropagate the results. Virtual loss keeps leaves of the batch apart.
+        """
+        leaves = []
+        for _ in range(size):
+            state = snapshot.clone_and_randomize(vanilla=kwargs.get('vanilla', True), rng=self.rng)
+            node = self.select(state, rootnode)
+            node = self.expand(state, node)
+            node.add_virtual_loss(1)
+            leaves.append((state, node))
+
+        winners = simulate_batch([state.compact() for state, node in leaves], self.rng)
+        for (state, node), winner in zip(leaves, winners):
+            node.add_virtual_loss(-1)
+            self.backpropagate(state, node, state.user_ctl.users[winner])
+
+    def parallel_search(self, snapshot, itermax, workers, **kwargs):
+        """ Root parallelization: every worker process builds its own tree from independent determinizations,
+            statistic of root children is summed up into a single root node.
+        """
+        # the transposition table is not sent to the workers, every worker gets its own random stream
+        jobs = [(type(self)(policy=self.policy, rng=rng), snapshot,
+                 itermax and itermax // workers + (index < itermax % workers), kwargs)
+                for index, rng in enumerate(split(self.rng, workers))]
+
+        with Pool(workers) as pool:
+            results = pool.map(_search_worker, jobs)
+
+        rootnode = Node()
+        self.iterations = 0
+        for iterations, children in results:
+            self.iterations += iterations
+            merge_children(rootnode, children)
+        return rootnode
+
+    def tree_parallel_search(self, snapshot, itermax, threads, **kwargs):
+        """ Tree parallelization: threads share a single tree. Selection, expansion and backpropagation hold
+            the tree lock, simulations run concurrently. Virtual loss spreads the threads across the tree.
+        """
+        rootnode = kwargs.pop('rootnode', None) or Node()
+        lock = Lock()
+        self.iterations = 0
+
+        def worker():
+            while True:
+                with lock:
+                    if not in_budget(self.iterations, itermax, kwargs.get('deadline')):
+                        return
+                    self.iterations += 1
+                    state = snapshot.clone_and_randomize(vanilla=kwargs.get('vanilla', True), rng=self.rng)
+                    node = self.select(state, rootnode)
+                    node = self.expand(state, node)
+                    node.add_virtual_loss(1)
+
+                self.simulate(state)
+
+                with lock:
+                    node.add_virtual_loss(-1)
+                    self.backpropagate(state, node)
+
+        workers = [Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return rootnode
+
+    def get_move(self, rootstate, itermax=None, verbose = True, **kwargs):
         """ Conduct an ISMCTS search for itermax iterations starting from rootstate.
             Return the best move from the rootstate.
+            If budget argument is given, the search stops after that many seconds even if itermax is not reached.
+            If workers argument is greater than 1, iterations are split between that many processes.
+            If threads argument is greater than 1, that many threads search a shared tree.
+            If batch argument is greater than 1, leaves are played out in batches of that size by rollout module.
+            If the algorithm has a transposition table, statistic of earlier searches from the same information set
+            is reused. If the algorithm has an opening book, openings are played from the book without search.
+            If the algorithm keeps trees, the search continues the tree of the previous move of the player.
+            If stats argument is given, statistic of the search is added to that SearchStats, phases are only timed
+            by the serial search.
         """
 
         # print(rootstate.playerHands[rootstate.playerToMove])
 
         assert len(rootstate.playerHands[rootstate.playerToMove]) == 2
+        assert itermax or kwargs.get('budget')
+
+        if kwargs.get('budget'):
+            kwargs['deadline'] = time() + kwargs.pop('budget')
+        self.iterations = 0
+        stats = kwargs.pop('stats', None) or NULL_STATS
+        stats.begin()
 
         move, victim, guess = get_move(rootstate, ismcts=True)
 
         if move:
+            stats.end()
             return move, victim, guess
 
-        rootnode = Node()
-        counter = 0
-        for i in range(itermax):
-            node = rootnode
-            # determinize
-            state = rootstate.clone_and_randomize(vanilla=kwargs.get('vanilla', True))
-            node = self.select(state, node)
-            node = self.expand(state, node)
-            self.simulate(state)
-            self.backpropagate(state, node)
+        # pack root state once, every determinization is built from the snapshot
+        snapshot = rootstate.compact()
+
+        if self.book is not None:
+            children = self.book.lookup(snapshot)
+            if children:
+                rootnode = Node()
+                merge_children(rootnode, [(move, rootstate.playerToMove.uid, wins, visits, avails)
+                                          for move, wins, visits, avails in children])
+                stats.end()
+                return self.select_final_move(rootnode, rootstate)
+
+        # only iterations missing in the statistic of the same information set are made
+        key, children = None, []
+        if self.table is not None:
+            key = self.table.key(snapshot)
+            children = self.table.get(key, [])
+            if itermax:
+                itermax = max(itermax - sum(visits for move, player, wins, visits, avails in children), 0)
+
+        # continue the tree of the previous move
+        rootnode = self.reused_root(rootstate) if self.keep_trees else None
+
+        workers = kwargs.pop('workers', 1)
+        threads = kwargs.pop('threads', 1)
+        if itermax == 0:
+            # statistic of the information set is complete already
+            rootnode = rootnode or Node()
+        elif workers > 1:
+            # worker trees start from scratch, statistic of the kept tree is added to their root children
+            reused, rootnode = rootnode, self.parallel_search(snapshot, itermax, workers, **kwargs)
+            if reused:
+                merge_children(rootnode, children_statistic(reused))
+        elif threads > 1:
+            rootnode = self.tree_parallel_search(snapshot, itermax, threads, rootnode=rootnode, **kwargs)
+        else:
+            rootnode = self.search(snapshot, itermax, rootnode=rootnode, stats=stats, **kwargs)
+
+        if self.table is not None:
+            merge_children(rootnode, children)
+            self.table.put(key, children_statistic(rootnode))
+
+        if self.keep_trees:
+            self.trees[rootstate.playerToMove.uid] = (id(rootstate), rootstate.round, [
+                (player.uid, card.id) for player, card in rootstate.currentTrick], rootnode)
+
+        stats.add_iterations(self.iterations)
+        stats.add_tree(rootnode)
+        stats.end()
 
         # Output some information about the tree - can be omitted
         if verbose:
             print(rootnode.children_to_string())
+            print("{} iterations".format(self.iterations))
 
         return self.select_final_move(rootnode, rootstate)
 
 
+def in_budget(iterations, itermax, deadline):
+    """
+    :param iterations: number of iterations made so far
+    :param itermax: maximal number of iterations, None if not limited
+    :param deadline: time when search must stop, None if not limited
+    :return: True if search can make one more iteration
+    """
+    return (itermax is None or iterations < itermax) and (deadline is None or time() < deadline)
+
+
+def children_statistic(rootnode):
+    """
+    :return: list of move, uid of the player, wins, visits and availability count of every child of the root node
+    """
+    return [(child.move, child.playerJustMoved, child.wins, child.visits, child.avails)
+            for child in rootnode.childNodes]
+
+
+def merge_children(rootnode, children):
+    """
+    Add statistic of children, e.g. from another search tree, to the children of the root node
+    :param children: list returned by children_statistic
+    """
+    for move, player, wins, visits, avails in children:
+        child = rootnode.get_child(move)
+        if not child:
+            child = rootnode.add_child(move, player)
+            child.avails = 0
+        child.wins += wins
+        child.visits += visits
+        child.avails += avails
+
+
+def _search_worker(job):
+    """ Search in a worker process of ISMCTS.parallel_search.
+        Return number of made iterations and statistic of root children.
+    """
+    algorithm, snapshot, itermax, kwargs = job
+    rootnode = algorithm.search(snapshot, itermax, **kwargs)
+    return algorithm.iterations, children_statistic(rootnode)
+
+
 class Smart_ISMCTS(ISMCTS):
 
     def get_move_by_policy(self, state, untried_moves, **kwargs):
@@ -119,8 +374,9 @@ class Smart_ISMCTS(ISMCTS):
         kwargs['extra'] = True
         return super(Smart_ISMCTS, self).select(state, node, **kwargs)
 
-    def get_move(self, rootstate, itermax, verbose = False, **kwargs):
-        return super(Smart_ISMCTS, self).get_move(rootstate, itermax, verbose=verbose, vanilla=False)
+    def get_move(self, rootstate, itermax=None, verbose = False, **kwargs):
+        kwargs['vanilla'] = False
+        return super(Smart_ISMCTS, self).get_move(rootstate, itermax, verbose=verbose, **kwargs)
 
     def select_final_move(self, rootnode, rootstate):
         node = max(rootnode.childNodes, key=lambda c: c.visits)
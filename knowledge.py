@@ -0,0 +1,78 @@
+"""
+Card counting tables shared by the game, the strategies and the search.
+Every table is keyed by the multiset of cards known to a player, a tuple indexed by card id (see known_cards),
+and is built once per multiset, so lookups during the search don't count cards again.
+"""
+
+from functools import lru_cache
+
+from cardclasses import cards_by_id, Guard
+
+GUARD = Guard().id
+
+
+def known_cards(used_cards, *card_lists):
+    """
+    :param used_cards: dict with number of used cards
+    :param card_lists: other known cards, e.g. hand of the player and his wrong guesses
+    :return: tuple with number of known cards indexed by card id
+    """
+    counts = [0] * len(cards_by_id)
+    for card, counter in used_cards.items():
+        counts[card.id] += counter
+    for cards in card_lists:
+        for card in cards:
+            counts[card.id] += 1
+    return tuple(counts)
+
+
+@lru_cache(maxsize=None)
+def remaining_cards(known):
+    """
+    :param known: tuple with number of known cards indexed by card id
+    :return: tuple with number of unknown cards indexed by card id,
+             negative if a card is known more times than it is in the deck (e.g. wrong guess of a card played later)
+    """
+    return tuple(card.max_count - counter if card else 0 for card, counter in zip(cards_by_id, known))
+
+
+@lru_cache(maxsize=None)
+def guess_candidates(known):
+    """
+    :return: tuple of unknown cards but Guard, every card is repeated as many times as it may be in the deck
+    """
+    return tuple(card for card, counter in zip(cards_by_id, remaining_cards(known)) if card and card.id != GUARD
+                 for _ in range(counter))
+
+
+@lru_cache(maxsize=None)
+def guess_ranking(known):
+    """
+    :return: tuple of cards but Guard from the most probable guess to the least probable one
+    """
+    counts = remaining_cards(known)
+    return tuple(card for counter, card in sorted(((counts[card.id], card) for card in cards_by_id[1:]
+                                                   if card.id != GUARD), reverse=True))
+
+
+@lru_cache(maxsize=None)
+def most_probable_guesses(known):
+    """
+    :return: tuple of cards but Guard with the greatest number of unknown cards
+    """
+    counts = remaining_cards(known)
+    ranking = guess_ranking(known)
+    return tuple(card for card in ranking if counts[card.id] == counts[ranking[0].id])
+
+
+@lru_cache(maxsize=None)
+def baron_win_ratio(known, card):
+    """
+    :param card: card left in hand after playing the Baron
+    :return: share of unknown cards lower than the card, 0 if no cards are unknown
+    """
+    counts = remaining_cards(known)
+    left = sum(counter for counter in counts if counter > 0)
+    if not left:
+        return 0.0
+    return sum(counts[card_id] for card_id in range(1, card.id) if counts[card_id] > 0) / left
@@ -1,29 +1,70 @@
-from copy import deepcopy
+from time import time
 
+from ismcts import in_budget
 from strategy import get_guess_card
 from collections import defaultdict
 from rule_based import get_move
+from stats import NULL_STATS
 
 
 class Minimax:
     INF = 1 << 30
+    iterations = 0  # number of determinizations searched by the last get_move call
+    nodes = 0  # number of positions searched by the last get_move call
+    max_depth = 0
 
     @staticmethod
-    def get_move(state):
+    def get_move(state, **kwargs):
+        """
+        Search determinizations of the state with alpha-beta and vote for the most frequent best move
+        :param determinizations: number of determinizations to search, 201 by default
+        :param budget: if given, stop searching after that many seconds
+        :param table: if given, TranspositionTable keeping votes of earlier searches from the same information set,
+                      only missing determinizations are searched
+        :param rng: random stream of the search, the stream of the state by default
+        :param stats: if given, SearchStats to add statistic of the search to, searched positions are counted
+                      as tree size
+        :return: move, victim and guess
+        """
         # print(state.playerHands[state.playerToMove])
+        deadline = time() + kwargs['budget'] if kwargs.get('budget') else None
+        stats = kwargs.get('stats') or NULL_STATS
+        stats.begin()
         move, victim, guess = get_move(state, ismcts=True)
 
         if move:
+            stats.end()
             return move, victim, guess
 
         move_counter = defaultdict(int)
         moves = state.get_moves()
 
-        for _ in range(201):
-            rootstate = state.clone_and_randomize()
+        snapshot = state.compact()
+        determinizations = kwargs.get('determinizations', 201)
+        table = kwargs.get('table')
+        if table is not None:
+            key = table.key(snapshot)
+            move_counter.update(table.get(key, {}))
+            if determinizations:
+                determinizations = max(determinizations - sum(move_counter.values()), 0)
+
+        Minimax.iterations = Minimax.nodes = Minimax.max_depth = 0
+        while in_budget(Minimax.iterations, determinizations, deadline):
+            Minimax.iterations += 1
+            clock = stats.tick()
+            rootstate = snapshot.clone_and_randomize(rng=kwargs.get('rng') or state.rng)
+            clock = stats.record('determinize', clock)
             value, move = Minimax._minimax(rootstate, True, -Minimax.INF, Minimax.INF, 1)
+            stats.record('search', clock)
             move_counter[move] += 1
 
+        stats.add_iterations(Minimax.iterations)
+        stats.add_nodes(Minimax.nodes, Minimax.max_depth)
+        stats.end()
+
+        if table is not None:
+            table.put(key, dict(move_counter))
+
         # from pprint import pprint
         # pprint(move_counter)
 
@@ -37,7 +78,9 @@ class Minimax:
 
     @staticmethod
     def _minimax(state, is_maximizing_player, alpha, beta, depth):
+        Minimax.nodes += 1
         if state.round_over:
+            Minimax.max_depth = max(Minimax.max_depth, depth)
             try:
                 assert len([1 for user in state.user_ctl.users if user.lost]) == 1 or not state.deck
             except AssertionError:
@@ -82,7 +125,8 @@ class Minimax:
         previous_move = None
         best_move = None
 
-        for move in state.get_moves():
+        # copy moves, the hand is changed while the children are searched
+        for move in list(state.get_moves()):
             if move == previous_move:
                 continue
             previous_move = move
@@ -91,11 +135,11 @@ class Minimax:
             if move.name == "Guard":
                 victim, guess = get_guess_card(state.user_ctl.users, state.playerToMove, state.seen_cards)
 
-            state_copy = deepcopy(state)
+            record = state.make_move(move, victim=victim, guess=guess)
 
-            state_copy.do_move(move, victim=victim, guess=guess)
+            value, _ = Minimax._minimax(state, not is_maximizing_player, alpha, beta, depth + 1)
 
-            value, _ = Minimax._minimax(state_copy, not is_maximizing_player, alpha, beta,depth + 1)
+            state.undo_move(record)
 
             if is_maximizing_player:
                 if best_value < value:
@@ -1,42 +1,59 @@
-from math import sqrt, log
+from selection import UCB1
 
-from cardclasses import Princess
 
 class Node:
     """ A node in the game tree. Note wins is always from the viewpoint of playerJustMoved.
+        Nodes keep the uid of the player rather than the player itself, so players of determinizations are
+        released after the iteration.
     """
 
+    __slots__ = ('move', 'parentNode', 'children', 'wins', 'visits', 'avails', 'virtual_loss', 'playerJustMoved')
+
     def __init__(self, move=None, parent=None, playerJustMoved=None):
         self.move = move  # the move that got us to this node - "None" for the root node
         self.parentNode = parent  # "None" for the root node
-        self.childNodes = []
+        self.children = None  # child nodes by card id of the move in order of adding, created with the first child
         self.wins = 0
         self.visits = 0
         self.avails = 1
-        self.playerJustMoved = playerJustMoved  # the only part of the state that the Node needs later
+        self.virtual_loss = 0  # number of tree-parallel iterations currently passing through the node
+        self.playerJustMoved = playerJustMoved  # uid of the player, the only part of the state the Node needs later
+
+    @property
+    def childNodes(self):
+        return list(self.children.values()) if self.children else []
+
+    def get_child(self, move):
+        """ Return the child node for the move, None if the move wasn't tried yet
+        """
+        return self.children.get(move.id) if self.children else None
 
     def get_untried_moves(self, legalMoves):
         """ Return the elements of legalMoves for which this node does not have children.
             length of legalMoves always be less that or equal to 2
         """
-
-        # Find all moves for which this node *does* have children
-        triedMoves = [child.move for child in self.childNodes]
-
-        # Return all moves that are legal but have not been tried yet
-        return [move for move in legalMoves if move not in triedMoves]
+        if not self.children:
+            return list(legalMoves)
+        return [move for move in legalMoves if move.id not in self.children]
 
     def ucb_select_child(self, legalMoves, exploration=0.7):
         """ Use the UCB1 formula to select a child node, filtered by the given list of legal moves.
             exploration is a constant balancing between exploitation and exploration, with default value 0.7 (approximately sqrt(2) / 2)
         """
+        return self.select_child(legalMoves, UCB1(exploration))
 
-        # Filter the list of children by the list of legal moves
-        legalChildren = [child for child in self.childNodes if child.move in legalMoves]
+    def select_child(self, legalMoves, policy):
+        """ Select a child node with the selection policy, filtered by the given list of legal moves.
+        """
+
+        # Filter the list of children by the list of legal moves, same cards in hand share a child
+        legalChildren = []
+        for move in legalMoves:
+            child = self.children[move.id]
+            if child not in legalChildren:
+                legalChildren.append(child)
 
-        # Get the child with the highest UCB score
-        s = max(legalChildren,
-                key=lambda c: float(c.wins) / float(c.visits) + exploration * sqrt(log(c.avails) / float(c.visits)))
+        s = policy.select(legalChildren)
 
         # Update availability counts -- it is easier to do this now than during backpropagation
         for child in legalChildren:
@@ -46,19 +63,35 @@ class Node:
         return s
 
     def add_child(self, m, p):
-        """ Add a new child node for the move m.
+        """ Add a new child node for the move m made by the player with uid p.
             Return the added child node
         """
         n = Node(move=m, parent=self, playerJustMoved=p)
-        self.childNodes.append(n)
+        if not self.children:
+            self.children = {}
+        self.children[m.id] = n
         return n
 
-    def update(self, terminalState):
-        """ Update this node - increment the visit count by one, and increase the win count by the result of terminalState for self.playerJustMoved.
+    def keep_children(self, moves):
+        """ Remove children for moves other than the given ones
+        """
+        if self.children:
+            self.children = {card_id: child for card_id, child in self.children.items() if child.move in moves}
+
+    def add_virtual_loss(self, loss):
+        """ Add loss to virtual loss of this node and all its ancestors
+        """
+        node = self
+        while node:
+            node.virtual_loss += loss
+            node = node.parentNode
+
+    def update(self, winner):
+        """ Update this node - increment the visit count by one, and increase the win count if self.playerJustMoved is the winner.
         """
         self.visits += 1
-        if self.playerJustMoved:
-            self.wins += terminalState.get_winner() == self.playerJustMoved
+        if self.playerJustMoved is not None:
+            self.wins += winner.uid == self.playerJustMoved
 
     def __repr__(self):
         return "[M:%s W/V/A: %4i/%4i/%4i]" % (self.move, self.wins, self.visits, self.avails)
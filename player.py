@@ -35,8 +35,8 @@ class PlayerCtl:
     def add(self, user):
         self.users.append(user)
 
-    def shuffle(self):
-        random.shuffle(self.users)
+    def shuffle(self, rng=random):
+        rng.shuffle(self.users)
 
     def get_current_player(self):
         """
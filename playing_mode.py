@@ -48,9 +48,17 @@ class PlayingMode:
 
         return move, left_players[victim_index], card
 
-    def __init__(self, state, mode, show_logs=True):
+    def __init__(self, state, mode, show_logs=True, budget=None):
+        """
+        :param budget: if given, seconds the opponent of real player may think on a move
+        """
+        # book module imports the game module, which imports this one
+        from book import open_book
+
         self.state = state
-        self.smart_ismcts = Smart_ISMCTS()
+        self.budget = budget
+        # openings are played from book.bin if it was built
+        self.smart_ismcts = Smart_ISMCTS(book=open_book())
         self.plain_ismct = ISMCTS()
         self.uct = Determinized_UCT()
         self.real_player = None
@@ -87,7 +95,7 @@ class PlayingMode:
         else:
             # return Minimax.get_move(self.state)
             assert self.state.playerToMove.algorithm == "ISMCTS"
-            return self.smart_ismcts.get_move(rootstate=self.state, itermax=8000)
+            return self.smart_ismcts.get_move(rootstate=self.state, itermax=8000, budget=self.budget)
 
     def __compare_bots(self, iterations):
         if self.state.playerToMove == self.player1:
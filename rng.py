@@ -0,0 +1,34 @@
+"""
+Random number streams.
+Every game state and search takes its random numbers from its own stream (the rng attribute or argument),
+the global random module is used when no stream is given. Streams of parallel workers are split from a single
+seeded stream, so parallel games and searches are reproducible and independent.
+"""
+
+import random
+
+
+class FastRandom(random.Random):
+    """
+    Mersenne Twister with choice and shuffle built on random(), which is faster than random.Random does
+    with rejection sampling. Bias of the choices is below 2 ** -53.
+    """
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def shuffle(self, x):
+        rand = self.random
+        for i in range(len(x) - 1, 0, -1):
+            j = int(rand() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+
+def split(rng, n):
+    """
+    :param rng: stream to seed the new ones from, e.g. random.Random, FastRandom or random module
+    :param n: number of streams
+    :return: list of n streams of the same type as rng, random.Random if rng is the random module
+    """
+    factory = type(rng) if isinstance(rng, random.Random) else random.Random
+    return [factory(rng.getrandbits(64)) for _ in range(n)]
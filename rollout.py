@@ -0,0 +1,193 @@
+"""
+Random playouts on packed states.
+Playouts use the same rules and the same random policy as ISMCTS.simulate, but run on card ids and seat
+indices only, so no cards, players or messages are touched until the round is over.
+"""
+
+import random
+
+from cardclasses import cards_by_id, Guard, Priest, Baron, Maid, Prince, King, Countess, Princess
+from knowledge import remaining_cards, most_probable_guesses
+
+GUARD, PRIEST, BARON, MAID, PRINCE, KING, COUNTESS, PRINCESS = (card.id for card in (
+    Guard(), Priest(), Baron(), Maid(), Prince(), King(), Countess(), Princess()))
+MAX_COUNT = [card.max_count if card else 0 for card in cards_by_id]
+
+
+class Rollout(object):
+    """
+    Mutable round state of a single playout
+    """
+
+    __slots__ = ('n', 'hands', 'deck', 'out_card', 'used', 'lost', 'defence', 'seen', 'wrong', 'trick_sum',
+                 'last_card', 'to_move', 'next_player_index', 'winner', 'rng')
+
+    def __init__(self, snapshot, rng=random):
+        """
+        :param snapshot: CompactState with every hand known, e.g. packed determinization
+        :param rng: random stream of the playout
+        """
+        self.rng = rng
+        n = self.n = len(snapshot.uids)
+        self.hands = [list(hand) for hand in snapshot.hands]
+        self.deck = list(snapshot.deck)
+        self.out_card = snapshot.out_card
+        self.used = list(snapshot.used)
+        self.lost = [bool(snapshot.lost >> seat & 1) for seat in range(n)]
+        self.defence = [bool(snapshot.defence >> seat & 1) for seat in range(n)]
+        self.seen = list(snapshot.seen)
+        self.wrong = list(snapshot.wrong)
+        self.trick_sum = [0] * n
+        for seat, card_id in snapshot.trick:
+            self.trick_sum[seat] += cards_by_id[card_id].value
+        self.last_card = snapshot.trick[-1][1] if snapshot.trick else 0
+        self.to_move = snapshot.to_move
+        self.next_player_index = snapshot.next_player_index
+
+        self.winner = None
+        if snapshot.round_over:
+            self.winner = [seat for seat in range(n) if snapshot.won >> seat & 1][0]
+
+    def clean_cards(self, card, player):
+        """ Same as strategy.clean_cards
+        """
+        n, bit = self.n, 1 << card
+        if MAX_COUNT[card] > 1:
+            for observer in range(n):
+                self.seen[observer * n + player] &= ~bit
+        else:
+            for index in range(n * n):
+                self.seen[index] &= ~bit
+        if not self.wrong[player] & bit:
+            self.wrong[player] = 0
+
+    def add_seen_card(self, _from, to, card):
+        index = _from * self.n + to
+        if not self.seen[index] & 1 << card:
+            self.seen[index] = 1 << card
+
+    def draw(self, player):
+        if not self.deck:
+            self.deck.append(self.out_card)
+            self.out_card = 0
+        self.hands[player].append(self.deck.pop())
+
+    def guess(self, player, victim):
+        """ Same guess as Guard.activate makes during simulation
+        """
+        known = list(self.used)
+        for card in self.hands[player]:
+            known[card] += 1
+        for card in range(PRIEST, len(known)):
+            if self.wrong[victim] >> card & 1:
+                known[card] += 1
+        known = tuple(known)
+
+        if self.last_card == COUNTESS:
+            counts = remaining_cards(known)
+            if counts[PRINCE] > 0:
+                return PRINCE
+            if counts[KING] > 0:
+                return KING
+
+        return self.rng.choice(most_probable_guesses(known)).id
+
+    def step(self):
+        """ Make a move of the current player with the random policy
+        """
+        n, player = self.n, self.to_move
+        hand = self.hands[player]
+
+        if COUNTESS in hand and (KING in hand or PRINCE in hand):
+            move = COUNTESS
+        else:
+            move = self.rng.choice(hand)
+
+        self.defence[player] = False
+        self.clean_cards(move, player)
+
+        victims = [seat for seat in range(n) if seat != player and not self.defence[seat] and not self.lost[seat]]
+        victim = self.rng.choice(victims) if victims else None
+
+        hand.remove(move)
+        self.used[move] += 1
+        if move == PRINCE and victim is None:
+            self.clean_cards(hand[0], player)
+
+        if move == PRINCESS:
+            self.lost[player] = True
+        elif move == KING and victim is not None:
+            card1, card2 = hand.pop(), self.hands[victim].pop()
+            for observer in range(n):
+                if not self.lost[observer]:
+                    self.seen[observer * n + player] &= ~(1 << card1)
+                    self.seen[observer * n + victim] &= ~(1 << card2)
+            self.add_seen_card(victim, player, card2)
+            self.add_seen_card(player, victim, card1)
+            self.hands[victim].append(card1)
+            hand.append(card2)
+        elif move == PRINCE:
+            target = player if victim is None else victim
+            card = self.hands[target].pop()
+            if victim is not None:
+                for observer in range(n):
+                    self.seen[observer * n + victim] &= ~(1 << card)
+            self.used[card] += 1
+            if card == PRINCESS:
+                self.lost[target] = True
+            if victim is not None or card != PRINCESS:
+                self.draw(target)
+        elif move == MAID:
+            self.defence[player] = True
+        elif move == BARON and victim is not None:
+            own, other = hand[0], self.hands[victim][0]
+            if own > other:
+                self.used[other] += 1
+                self.lost[victim] = True
+            elif own < other:
+                self.used[own] += 1
+                self.lost[player] = True
+            else:
+                self.add_seen_card(player, victim, other)
+                self.add_seen_card(victim, player, own)
+        elif move == PRIEST and victim is not None:
+            self.add_seen_card(player, victim, self.hands[victim][0])
+        elif move == GUARD and victim is not None:
+            guess = self.guess(player, victim)
+            if guess in self.hands[victim]:
+                self.used[guess] += 1
+                self.lost[victim] = True
+            else:
+                self.wrong[victim] |= 1 << guess
+
+        self.trick_sum[player] += cards_by_id[move].value
+        self.last_card = move
+
+        left = [seat for seat in range(n) if not self.lost[seat]]
+        if len(left) == 1:
+            self.winner = left[0]
+        elif not self.deck:
+            # the greatest card wins, ties are broken by sum of played cards
+            self.winner = max(left, key=lambda seat: (self.hands[seat], self.trick_sum[seat], -seat))
+        else:
+            while self.lost[self.next_player_index]:
+                self.next_player_index = (self.next_player_index + 1) % n
+            self.to_move = self.next_player_index
+            self.next_player_index = (self.next_player_index + 1) % n
+            self.draw(self.to_move)
+
+
+def simulate_batch(snapshots, rng=random):
+    """
+    Play out packed states in lock-step until every round is over
+    :param snapshots: list of CompactState with every hand known
+    :param rng: random stream of the playouts, e.g. rng.FastRandom
+    :return: list of winner seats
+    """
+    rollouts = [Rollout(snapshot, rng) for snapshot in snapshots]
+    active = [rollout for rollout in rollouts if rollout.winner is None]
+    while active:
+        for rollout in active:
+            rollout.step()
+        active = [rollout for rollout in active if rollout.winner is None]
+    return [rollout.winner for rollout in rollouts]
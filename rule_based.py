@@ -1,8 +1,7 @@
 #coding=utf-8
 
-import random
-
-from cardclasses import Guard, Princess, Priest, Prince, Baron, Maid, Countess, King, card_dict
+from cardclasses import Guard, Princess, Priest, Prince, Baron, Maid, Countess, King, cards_by_id
+from knowledge import known_cards, remaining_cards, most_probable_guesses
 from strategy import get_guess_card
 
 
@@ -23,45 +22,27 @@ def get_move(state, ismcts=False):
 
     victim, guess = get_guess_card(state.user_ctl.users, state.playerToMove, state.seen_cards)
 
-    card_count = {
-        Princess(): 1,
-        Countess(): 1,
-        King(): 1,
-        Prince(): 2,
-        Maid(): 2,
-        Baron(): 2,
-        Priest(): 2,
-        Guard(): 5,
-    }
-    # substract used cards
-    for card, counter in state.used_cards.items():
-        card_count[card] -= counter
-        assert card_count[card] >= 0
-
-    # substract cards in hand
-    for card in state.playerHands[state.playerToMove]:
-        card_count[card] -= 1
-        assert card_count[card] >= 0
+    # cards that are neither used nor in hand
+    known = known_cards(state.used_cards, cards)
+    card_count = remaining_cards(known)
 
     def play_guard():
         """
         Selects probable guess when playing with Guard
         :return: probable guess card
         """
-        available_cards = sorted([(counter, card) for card, counter in card_count.items() if card != guard], reverse=True)
-        most_probable_cards = [card for counter, card in available_cards if counter == available_cards[0][0]]
-        return random.choice(most_probable_cards)
+        return state.rng.choice(most_probable_guesses(known))
 
     def get_probability(player_card):
         c = 0
-        if card_count[player_card] > 0:
+        if card_count[player_card.id] > 0:
             for card in twin_cards:
-                if card_count[card] == 2 or (card_count[card] == 1 and card in cards):
+                if card_count[card.id] == 2 or (card_count[card.id] == 1 and card in cards):
                     c += 1
             return 1 / c
 
-        for card, counter in card_count.items():
-            if counter > 0 or card in cards:
+        for card in cards_by_id[1:]:
+            if card_count[card.id] > 0 or card in cards:
                 c += 1
 
         return 1 / c
@@ -111,7 +92,7 @@ def get_move(state, ismcts=False):
         return prince, victim, None
 
     # make last move with minimal card
-    if sum(card_count.values()) <= 2:
+    if sum(card_count) <= 2:
         card = min(cards)
         if card == guard:
             guess = play_guard()
@@ -134,7 +115,7 @@ def get_move(state, ismcts=False):
         pdb.set_trace()
 
     # if both cards are same, play any of them
-    for card in card_dict.values():
+    for card in cards_by_id[1:]:
         if cards.count(card) == 2:
             if card == guard:
                 guess = play_guard()
@@ -144,7 +125,7 @@ def get_move(state, ismcts=False):
     # return seen card by an opponent if any
     for card in cards:
         # TODO: когда мы не видели карту, но нашего барона видели, а вторая карта слишком маленькая
-        if not ismcts and card != guard and card in state.seen_cards[opponent][state.playerToMove] and card_count[guard] > 0 and not lose_with_baron(card):
+        if not ismcts and card != guard and card in state.seen_cards[opponent][state.playerToMove] and card_count[guard.id] > 0 and not lose_with_baron(card):
             return card, victim, guess
 
     # Guard and Priest
@@ -154,7 +135,7 @@ def get_move(state, ismcts=False):
     # check if twin card has high prob to be guessed
     for card in twin_cards:
         # TODO: когда мы не видели карту, но нашего барона видели, а вторая карта слишком маленькая
-        if not ismcts and card in cards and get_probability(card) >= 0.5 and card_count[guard] > 0 and not lose_with_baron(card):
+        if not ismcts and card in cards and get_probability(card) >= 0.5 and card_count[guard.id] > 0 and not lose_with_baron(card):
             return card, victim, guess
 
     # return nothing for ismcts algorithm
@@ -0,0 +1,83 @@
+"""
+Selection policies of the tree search.
+A policy scores the legal children of a fully expanded node by their statistic and selects the child
+with the greatest score. Pass a policy to ISMCTS, e.g. Smart_ISMCTS(policy=UCB1Tuned()).
+"""
+
+from math import log, sqrt
+
+# natural logarithms of availability counts, index 0 is never used
+_logs = [0.0]
+
+
+def cached_log(n):
+    """
+    :param n: positive integer
+    :return: natural logarithm of n from the table, the table is grown twice when n is out of it
+    """
+    if n >= len(_logs):
+        _logs.extend([log(i) for i in range(len(_logs), 2 * n + 1)])
+    return _logs[n]
+
+
+class UCB1(object):
+    """
+    Upper confidence bound, exploration is a constant balancing between exploitation and exploration,
+    0.7 by default (approximately sqrt(2) / 2)
+    """
+
+    def __init__(self, exploration=0.7):
+        self.exploration = exploration
+
+    def select(self, children):
+        exploration = self.exploration
+        best, best_score = None, None
+        for child in children:
+            # virtual loss counts as visits without wins
+            visits = child.visits + child.virtual_loss
+            score = child.wins / visits + exploration * sqrt(cached_log(child.avails) / visits)
+            if best is None or score > best_score:
+                best, best_score = child, score
+        return best
+
+
+class UCB1Tuned(object):
+    """
+    UCB1 with the exploration term bounded by the variance of the wins
+    """
+
+    def select(self, children):
+        best, best_score = None, None
+        for child in children:
+            visits = child.visits + child.virtual_loss
+            mean = child.wins / visits
+            term = cached_log(child.avails) / visits
+            score = mean + sqrt(term * min(0.25, mean - mean * mean + sqrt(2 * term)))
+            if best is None or score > best_score:
+                best, best_score = child, score
+        return best
+
+
+class PUCT(object):
+    """
+    Predictor upper confidence bound, exploration of a child is proportional to the prior probability of its move
+    """
+
+    def __init__(self, exploration=1.0, prior=None):
+        """
+        :param prior: dict of weights by card, moves not in the dict get weight 1, so the prior is uniform by default
+        """
+        self.exploration = exploration
+        self.prior = prior or {}
+
+    def select(self, children):
+        weights = [self.prior.get(child.move, 1.0) for child in children]
+        total = sum(weights)
+        best, best_score = None, None
+        for child, weight in zip(children, weights):
+            visits = child.visits + child.virtual_loss
+            score = child.wins / visits + \
+                self.exploration * weight / total * sqrt(child.avails) / (1 + visits)
+            if best is None or score > best_score:
+                best, best_score = child, score
+        return best
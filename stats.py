@@ -0,0 +1,122 @@
+"""
+Instrumentation of the searches.
+Pass stats=SearchStats() to get_move of ISMCTS, Determinized_UCT or Minimax to get time of every phase of the
+search, number of iterations, rollout lengths, tree size, depth and allocated memory blocks. Without the argument
+the searches report to NULL_STATS, which does nothing.
+"""
+
+import sys
+from collections import Counter
+from time import perf_counter
+
+
+class SearchStats(object):
+    """
+    Statistic of a single search
+    """
+
+    def __init__(self):
+        self.phases = Counter()  # seconds spent in every phase
+        self.time = 0.0  # seconds spent in get_move
+        self.iterations = 0
+        self.rollouts = Counter()  # number of rollouts by number of moves in them
+        self.tree_size = 0  # number of nodes, summed up over trees of the search
+        self.max_depth = 0
+        self.allocated_blocks = 0  # memory blocks allocated by the search and not released
+        self._start = None
+        self._blocks = None
+
+    def begin(self):
+        self._start = perf_counter()
+        self._blocks = sys.getallocatedblocks()
+
+    def end(self):
+        self.time += perf_counter() - self._start
+        self.allocated_blocks += sys.getallocatedblocks() - self._blocks
+
+    def tick(self):
+        """
+        :return: current time to pass to record
+        """
+        return perf_counter()
+
+    def record(self, phase, start):
+        """
+        Add time since start to the phase
+        :return: current time, the start of the next phase
+        """
+        now = perf_counter()
+        self.phases[phase] += now - start
+        return now
+
+    def add_iterations(self, iterations):
+        self.iterations += iterations
+
+    def add_rollout(self, moves):
+        self.rollouts[moves] += 1
+
+    def add_nodes(self, nodes, depth):
+        """
+        Add searched nodes, e.g. positions searched by alpha-beta
+        :param depth: maximal depth of the nodes
+        """
+        self.tree_size += nodes
+        self.max_depth = max(self.max_depth, depth)
+
+    def add_tree(self, rootnode):
+        """
+        Add size and depth of the search tree
+        """
+        nodes = [(rootnode, 0)]
+        while nodes:
+            node, depth = nodes.pop()
+            self.add_nodes(1, depth)
+            nodes.extend((child, depth + 1) for child in node.childNodes)
+
+    def to_dict(self):
+        rollouts = sum(self.rollouts.values())
+        return dict(time=self.time, phases=dict(self.phases), iterations=self.iterations,
+                    iterations_per_second=self.iterations / self.time if self.time else 0.0,
+                    rollouts=rollouts,
+                    mean_rollout_length=sum(moves * count for moves, count in self.rollouts.items()) / rollouts
+                    if rollouts else 0.0,
+                    max_rollout_length=max(self.rollouts) if rollouts else 0,
+                    tree_size=self.tree_size, max_depth=self.max_depth, allocated_blocks=self.allocated_blocks)
+
+    def __repr__(self):
+        phases = ", ".join("{} {:.3f}s".format(phase, seconds) for phase, seconds in sorted(self.phases.items()))
+        return "{} iterations in {:.3f}s ({}), tree of {} nodes, depth {}".format(
+            self.iterations, self.time, phases, self.tree_size, self.max_depth)
+
+
+class NullStats(object):
+    """
+    Statistic of a search which is not instrumented
+    """
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+    def tick(self):
+        return 0
+
+    def record(self, phase, start):
+        return 0
+
+    def add_iterations(self, iterations):
+        pass
+
+    def add_rollout(self, moves):
+        pass
+
+    def add_nodes(self, nodes, depth):
+        pass
+
+    def add_tree(self, rootnode):
+        pass
+
+
+NULL_STATS = NullStats()
@@ -3,22 +3,29 @@ from collections import defaultdict
 import random
 
 from cardclasses import Guard, Priest, Baron, Maid, Prince, King, Countess, Princess
+from knowledge import known_cards, remaining_cards, baron_win_ratio
 
 
-def clean_cards(move, wrong_guesses, seen_cards, player_to_move):
+def clean_cards(move, wrong_guesses, seen_cards, player_to_move, record=None):
 
     if move.max_count > 1:
         for player in seen_cards:
             if move in seen_cards[player][player_to_move]:
+                if record:
+                    record.save_list(seen_cards[player][player_to_move])
                 seen_cards[player][player_to_move].remove(move)
     else:
         # remove non-twin card all player's seen card
         for p1 in seen_cards:
             for p2 in seen_cards:
                 if move in seen_cards[p1][p2]:
+                    if record:
+                        record.save_list(seen_cards[p1][p2])
                     seen_cards[p1][p2].remove(move)
 
     if move not in wrong_guesses:
+        if record:
+            record.save_list(wrong_guesses)
         del wrong_guesses[:]
 
 
@@ -38,8 +45,11 @@ def get_optimal_move(current_player, available_moves, used_cards, wrong_guesses,
     if len(available_moves) == 1:
         return available_moves[0], None, None
 
+    # random stream of the state
+    rng = kwargs.get('rng', random)
+
     if kwargs.get('random', False):
-        return random.choice(available_moves), None, None
+        return rng.choice(available_moves), None, None
 
     maid = Maid()
     guard = Guard()
@@ -49,29 +59,14 @@ def get_optimal_move(current_player, available_moves, used_cards, wrong_guesses,
     prince = Prince()
     king = King()
 
-    card_count = {
-        princess: 1,
-        Countess(): 1,
-        king: 1,
-        prince: 2,
-        maid: 2,
-        baron: 2,
-        priest: 2,
-        guard: 5,
-    }
-    # remove already used cards from cards counter
-    for card, counter in used_cards.items():
-        card_count[card] -= counter
-        assert card_count[card] >= 0
-    # remove cards in hand from cards counter
-    for card in hand:
-        card_count[card] -= 1
-        assert card_count[card] >= 0
+    # cards that are neither used nor in hand
+    known = known_cards(used_cards, hand)
+    card_count = remaining_cards(known)
 
     available_moves.sort()
     left_players = [player for player in users if not player.lost and player != current_player]
 
-    opponent = random.choice(left_players) or None
+    opponent = rng.choice(left_players) or None
 
     # AI plays against single human player
     if real_players and real_players[0] != current_player and not real_players[0].defence and not real_players[0].lost:
@@ -94,13 +89,13 @@ def get_optimal_move(current_player, available_moves, used_cards, wrong_guesses,
     if opponent.defence:
 
         if guard in available_moves and priest in available_moves:
-            if card_count[guard] > 0 and cards_left <= 1:
+            if card_count[guard.id] > 0 and cards_left <= 1:
                 return guard, None, None
             else:
                 return priest, None, None
 
         if guard in available_moves and maid in available_moves:
-            if card_count[guard] > 0:
+            if card_count[guard.id] > 0:
                 if maid in watched_cards:
                     return maid, None, None
             if cards_left <= 1:
@@ -108,10 +103,10 @@ def get_optimal_move(current_player, available_moves, used_cards, wrong_guesses,
             else:
                 return maid, None, None
 
-        if prince in available_moves and card_count[guard] > 0 and prince in watched_cards:
+        if prince in available_moves and card_count[guard.id] > 0 and prince in watched_cards:
             return prince, None, None
 
-        if king in available_moves and card_count[guard] > 0 and king in watched_cards:
+        if king in available_moves and card_count[guard.id] > 0 and king in watched_cards:
             return king, None, None
 
         return available_moves[0], None, None
@@ -135,14 +130,8 @@ def get_optimal_move(current_player, available_moves, used_cards, wrong_guesses,
     # decide when to play with baron
     if baron in available_moves:
         second_card = available_moves[0] if available_moves[0] != baron else available_moves[1]
-        left_card_counter, gt_card_counter = 0, 0
-
-        for card, counter in card_count.items():
-            left_card_counter += counter
-            if card < second_card:
-                gt_card_counter += counter
 
-        if gt_card_counter / left_card_counter >= 0.6:
+        if baron_win_ratio(known, second_card) >= 0.6:
             return baron, opponent, None
 
     # if priest and guard in hand, make move with priest
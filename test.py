@@ -1,13 +1,25 @@
+import random
 from collections import defaultdict
+from copy import deepcopy
 
 import pytest
 
-from game import LoveLetterState, PlayerCtl, Player
+from game import LoveLetterState, PlayerCtl, Player, load_decks
+from benchmark import build_corpus, operation_times
+from book import OpeningBook, opening_key, opening_state, write_book
 from cardclasses import *
-from ismcts import Smart_ISMCTS, ISMCTS
+from ismcts import Smart_ISMCTS, ISMCTS, children_statistic
+from knowledge import known_cards, remaining_cards, most_probable_guesses, baron_win_ratio
 from minimax import Minimax
+from node import Node
+from rng import FastRandom, split
+from rollout import simulate_batch
+from selection import UCB1, UCB1Tuned, PUCT, cached_log
+from stats import SearchStats
 from strategy import get_guess_card
+from tournament import play_game, confidence_interval
 from uct import Determinized_UCT
+from utils import TranspositionTable
 
 
 @pytest.fixture
@@ -126,4 +138,307 @@ def test_minimax(init_game):
     game.used_cards[Maid()] = 1
     game.used_cards[King()] = 1
 
-    Determinized_UCT().get_move(rootstate=game, itermax=5000, verbose=True)
\ No newline at end of file
+    Determinized_UCT().get_move(rootstate=game, itermax=5000, verbose=True)
+
+def test_compact_state(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Guard(), King()])
+    game.playerHands[player2].append(Priest())
+    game.seen_cards[player1][player2].append(Priest())
+
+    game.deck.remove(Guard())
+    game.deck.remove(King())
+    game.deck.remove(Priest())
+    game.out_card = game.deck.pop()
+
+    compact = game.compact()
+    assert compact.to_state().compact() == compact
+
+    clone = compact.clone_and_randomize()
+    assert clone.playerHands[player1] == [Guard(), King()]
+    assert clone.playerHands[player2] == [Priest()]
+    assert len(clone.deck) == len(game.deck)
+
+
+def test_cards_are_singletons():
+    assert Guard() is Guard() is card_dict['Guard']
+    assert deepcopy([Princess()])[0] is Princess()
+    assert sorted(card_dict.values()) == cards_by_id[1:]
+    assert [card.id for card in cards_by_id[1:]] == [card.value for card in cards_by_id[1:]]
+    assert len({King(), King(), Prince()}) == 2
+
+
+def test_undo_move(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Guard(), Prince()])
+    game.playerHands[player2].append(Priest())
+    game.seen_cards[player1][player2].append(Priest())
+
+    game.deck.remove(Guard())
+    game.deck.remove(Prince())
+    game.deck.remove(Priest())
+    game.out_card = game.deck.pop()
+
+    before = game.compact()
+    record = game.make_move(Prince(), victim=player2)
+    assert game.used_cards[Priest()] == 1
+    assert not game.seen_cards[player1][player2]
+
+    game.undo_move(record)
+    assert game.compact() == before
+    assert game.playerHands[player2] == [Priest()]
+
+
+@pytest.mark.parametrize('parallel', [dict(workers=2), dict(threads=3)])
+def test_parallel_ismcts(init_game, parallel):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    move, victim, guess = ISMCTS().get_move(game, itermax=200, verbose=False, **parallel)
+    assert move in (Priest(), Baron())
+
+
+def test_search_budget(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    ismcts = Smart_ISMCTS()
+    assert ismcts.get_move(game, budget=0.1)[0] in (Priest(), Baron())
+    assert ismcts.iterations > 0
+
+    assert Minimax.get_move(game, determinizations=10)[0] in (Priest(), Baron())
+    assert Minimax.iterations == 10
+
+
+def test_tournament_game_is_reproducible():
+    decks = load_decks()
+    assert play_game(['rule_based', 'rule_based'], decks, 7) == play_game(['rule_based', 'rule_based'], decks, 7)
+
+    lower, upper = confidence_interval(50, 100)
+    assert lower < 0.5 < upper
+
+
+def test_batch_rollouts(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    determinization = game.clone_and_randomize().compact()
+    assert set(simulate_batch([determinization] * 20)) <= {0, 1}
+
+    assert ISMCTS().get_move(game, itermax=100, verbose=False, batch=10)[0] in (Priest(), Baron())
+
+
+def test_knowledge_tables():
+    known = known_cards({Guard(): 3, Priest(): 2}, [Baron(), Baron()])
+    counts = remaining_cards(known)
+
+    assert counts[Guard.id] == 2 and counts[Priest.id] == 0 and counts[Baron.id] == 0 and counts[Princess.id] == 1
+    assert sum(counts) == 16 - 7
+    assert set(most_probable_guesses(known)) == {Maid(), Prince()}
+    assert remaining_cards(known_cards({Guard(): 3, Priest(): 2}, [Baron(), Baron()])) is counts
+
+    # Guard and Maid are lower than Prince among Guard, Guard, Maid, Maid, Prince, Prince, King, Countess, Princess
+    assert baron_win_ratio(known, Prince()) == 4 / 9
+
+
+def test_transposition_table(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    # hidden cards of the opponent don't change the information set
+    other = game.clone_and_randomize()
+    other.playerHands[other.user_ctl.users[0]] = [Baron(), Priest()]
+    other.playerHands[other.user_ctl.users[1]] = [Princess()]
+    assert TranspositionTable.key(game.compact()) == TranspositionTable.key(other.compact())
+    assert TranspositionTable.key(game.compact(), observer=1) != TranspositionTable.key(other.compact(), observer=1)
+
+    table = TranspositionTable()
+    ismcts = ISMCTS(table)
+    ismcts.get_move(game, itermax=200, verbose=False)
+    assert ismcts.iterations == 200 and len(table) == 1
+
+    # the statistic is complete, nothing is searched again
+    ismcts.get_move(other, itermax=200, verbose=False)
+    assert ismcts.iterations == 0 and table.hits == 1
+
+    table = TranspositionTable()
+    Minimax.get_move(game, determinizations=20, table=table)
+    Minimax.get_move(game, determinizations=30, table=table)
+    assert Minimax.iterations == 10 and len(table) == 1
+
+    table = TranspositionTable(capacity=2)
+    for key in range(3):
+        table.put(key, key)
+    assert 0 not in table and table.get(2) == 2
+
+
+def test_opening_book(tmp_path):
+    openings = [(2, Guard.id, Baron.id, 0), (2, Priest.id, Prince.id, Maid.id), (3, Maid.id, King.id, 0)]
+    entries = {}
+    for key in openings:
+        state = opening_state(key)
+        assert opening_key(state.compact()) == key
+        entries[key] = children_statistic(Smart_ISMCTS().search(state.compact(), 50, vanilla=False))
+    write_book(str(tmp_path / 'book.bin'), entries)
+
+    book = OpeningBook(str(tmp_path / 'book.bin'))
+    assert len(book) == 3
+    state = opening_state((2, Priest.id, Prince.id, Maid.id))
+    assert sum(visits for move, wins, visits, avails in book.lookup(state.compact())) == 50
+    assert book.lookup(opening_state((2, Guard.id, Priest.id, 0)).compact()) is None
+    assert Smart_ISMCTS(book=book).get_move(state, itermax=10)[0] in (Priest(), Prince())
+
+    state.do_move(Priest())
+    assert opening_key(state.compact()) is None
+    book.close()
+
+
+def test_tree_reuse(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    ismcts = ISMCTS()
+    ismcts.get_move(game, itermax=1000, verbose=False)
+    rootnode = ismcts.trees[player1.uid][-1]
+    child = next(child for child in rootnode.childNodes if child.move == Priest())
+
+    game.do_move(Priest(), victim=player2)
+    game.do_move(Guard(), victim=player1, guess=Princess())
+
+    # the tree is continued from the node of played moves, the rest of it is released
+    node = ismcts.reused_root(game)
+    assert node.parentNode is None and node in child.childNodes and node.visits > 0
+    assert all(c.move in game.get_moves() for c in node.childNodes)
+    assert player1.uid not in ismcts.trees and ismcts.reused_root(game) is None
+
+
+def test_node_children():
+    rootnode = Node()
+    assert not hasattr(rootnode, '__dict__')
+    assert rootnode.get_untried_moves([Guard(), Guard()]) == [Guard(), Guard()]
+
+    guard = rootnode.add_child(Guard(), 1)
+    assert rootnode.get_child(Guard()) is guard and rootnode.get_child(Baron()) is None
+    assert rootnode.get_untried_moves([Guard(), Baron()]) == [Baron()]
+
+    baron = rootnode.add_child(Baron(), 1)
+    guard.update(Player(1))
+    baron.update(Player(2))
+    # same cards in hand share a child
+    assert rootnode.ucb_select_child([Guard(), Guard()]) is guard and guard.avails == 2
+    assert rootnode.childNodes == [guard, baron]
+
+    rootnode.keep_children([Baron()])
+    assert rootnode.childNodes == [baron]
+
+
+@pytest.mark.parametrize('policy', [UCB1(), UCB1Tuned(), PUCT(prior={Baron(): 3})])
+def test_selection_policies(init_game, policy):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    rootnode = ISMCTS(policy=policy).search(game.compact(), 300)
+    assert sorted(child.move for child in rootnode.childNodes) == [Priest(), Baron()]
+    assert sum(child.visits for child in rootnode.childNodes) == 300
+    assert cached_log(1000) == pytest.approx(6.907755)
+
+
+def test_search_stats(init_game):
+    game, player1, player2 = init_game['game'], init_game['player1'], init_game['player2']
+
+    game.playerHands[player1].extend([Priest(), Baron()])
+    game.playerHands[player2].append(Guard())
+
+    game.deck.remove(Priest())
+    game.deck.remove(Baron())
+    game.deck.remove(Guard())
+    game.out_card = game.deck.pop()
+
+    stats = SearchStats()
+    ISMCTS().get_move(game, itermax=200, verbose=False, stats=stats)
+    assert stats.iterations == 200 and sum(stats.rollouts.values()) == 200
+    assert set(stats.phases) == {'determinize', 'select', 'expand', 'simulate', 'backpropagate'}
+    assert stats.tree_size > 2 and stats.max_depth >= 1 and 0 < sum(stats.phases.values()) <= stats.time
+
+    stats = SearchStats()
+    Determinized_UCT().get_move(game, itermax=200, verbose=False, trees_number=4, stats=stats)
+    assert stats.iterations == 200 and 'undo' in stats.phases and stats.tree_size >= 4
+
+    stats = SearchStats()
+    Minimax.get_move(game, determinizations=5, stats=stats)
+    assert stats.iterations == 5 and stats.tree_size >= 5 and set(stats.phases) == {'determinize', 'search'}
+    assert stats.to_dict()['iterations'] == 5
+
+
+def test_benchmark_corpus():
+    decks = load_decks()
+    corpus = build_corpus(decks, 3, seed=5)
+    assert all(not state.round_over and state.currentTrick for state in corpus)
+    assert [state.compact() for state in corpus] == [state.compact() for state in build_corpus(decks, 3, seed=5)]
+    assert set(operation_times(corpus, repeat=2)) == {'clone', 'clone_and_randomize', 'do_move'}
+
+
+def test_random_streams():
+    decks = load_decks()
+
+    def play(rng):
+        state = LoveLetterState(2, decks, rng)
+        state.start_new_round()
+        moves = []
+        while not state.round_over:
+            move, victim, guess = ISMCTS(rng=rng).get_move(state, itermax=20, verbose=False)
+            moves.append((move, victim, guess))
+            state.do_move(move, global_game=True, victim=victim, guess=guess, vanilla=False)
+        return moves
+
+    assert play(random.Random(3)) == play(random.Random(3))
+    assert play(FastRandom(3)) == play(FastRandom(3))
+
+    streams = split(FastRandom(1), 3)
+    assert all(type(stream) is FastRandom for stream in streams)
+    assert len({stream.random() for stream in streams}) == 3
+    assert [stream.random() for stream in split(random, 2)] != [stream.random() for stream in split(random, 2)]
@@ -0,0 +1,179 @@
+"""
+Batch self-play of the bots.
+Agents are given by specs "<algorithm>[:<iterations>]", e.g. smart_ismcts:8000, uct:5000, minimax:201, rule_based.
+Run `python3 tournament.py smart_ismcts:1000 minimax --games 1000` to play a match,
+every finished game is appended to the results file as a JSON line, followed by the summary.
+"""
+
+import argparse
+import json
+import random
+from collections import defaultdict
+from math import sqrt
+from multiprocessing import Pool
+
+from game import LoveLetterState, load_decks
+from ismcts import ISMCTS, Smart_ISMCTS
+from minimax import Minimax
+from rng import split
+from rule_based import get_move
+from uct import Determinized_UCT
+
+ALGORITHMS = {
+    'ismcts': ISMCTS,
+    'smart_ismcts': Smart_ISMCTS,
+    'uct': Determinized_UCT,
+    'minimax': Minimax,
+    'rule_based': None,
+}
+
+
+class Agent(object):
+    """
+    Bot playing with one of ALGORITHMS and an iteration budget
+    """
+
+    def __init__(self, spec, rng=None):
+        """
+        :param rng: random stream of the searches, the global random module by default
+        """
+        self.spec = spec
+        self.rng = rng
+        self.name, _, iterations = spec.partition(':')
+        self.iterations = int(iterations) if iterations else None
+
+        if self.name not in ALGORITHMS:
+            raise ValueError("Unknown algorithm {}, expected one of {}".format(self.name, ", ".join(ALGORITHMS)))
+        if self.name in ('ismcts', 'smart_ismcts', 'uct') and not self.iterations:
+            raise ValueError("Number of iterations is required for {}".format(self.name))
+
+        # Minimax and rule based agents have no state, they are called as functions
+        self.algorithm = ALGORITHMS[self.name](rng=rng) if self.name in ('ismcts', 'smart_ismcts', 'uct') else None
+
+    def get_move(self, state):
+        if self.name == 'rule_based':
+            return get_move(state)
+        if self.name == 'minimax':
+            return Minimax.get_move(state, determinizations=self.iterations or 201, rng=self.rng)
+        return self.algorithm.get_move(state, itermax=self.iterations, verbose=False)
+
+
+def play_game(specs, decks, seed):
+    """
+    Play a game between agents
+    :param specs: agent specs, the i-th agent plays for the player with uid i + 1
+    :param decks: decks specified in advance
+    :param seed: seed of the random stream of the game, streams of the agents are split from it
+    :return: index of the winner in specs and number of played rounds
+    """
+    rng = random.Random(seed)
+    agents = [Agent(spec, agent_rng) for spec, agent_rng in zip(specs, split(rng, len(specs)))]
+
+    state = LoveLetterState(len(agents), decks, rng)
+    state.start_new_round()
+    for user in state.user_ctl.users:
+        user.algorithm = specs[user.uid - 1]
+
+    while not state.game_over:
+        move, victim, guess = agents[state.playerToMove.uid - 1].get_move(state)
+        state.do_move(move, verbose=False, global_game=True, victim=victim, guess=guess, vanilla=False)
+
+    winner = [player for player in state.user_ctl.users if state.tricksTaken[player] == state.tricks_taken_limit][0]
+    return winner.uid - 1, state.round
+
+
+_decks = None
+
+
+def _init_worker(decks_path):
+    global _decks
+    _decks = load_decks(decks_path)
+
+
+def _play_game_worker(job):
+    index, specs, seed = job
+    winner, rounds = play_game(specs, _decks, seed)
+    return dict(game=index, seed=seed, agents=specs, winner=winner, rounds=rounds)
+
+
+def confidence_interval(wins, games, z=1.96):
+    """
+    Wilson score interval of the win rate
+    :param z: quantile of the normal distribution, 1.96 for 95% interval
+    :return: lower and upper bound
+    """
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    centre = (rate + z * z / (2 * games)) / denominator
+    spread = z * sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / denominator
+    return centre - spread, centre + spread
+
+
+def summarize(specs, results):
+    """
+    :return: number of games and win rate with its confidence interval for every agent
+    """
+    wins = defaultdict(int)
+    for result in results:
+        wins[result['winner']] += 1
+
+    games = len(results)
+    summary = dict(games=games, agents=[])
+    for index, spec in enumerate(specs):
+        lower, upper = confidence_interval(wins[index], games)
+        summary['agents'].append(dict(agent=spec, wins=wins[index], win_rate=wins[index] / games if games else 0.0,
+                                      ci95=[lower, upper]))
+    return summary
+
+
+def run_tournament(specs, games, results_path, processes=None, seed=0, decks_path='decks.txt'):
+    """
+    Play games between agents in a process pool
+    :param specs: agent specs of 2-4 players
+    :param games: number of games to play
+    :param results_path: file to write results of games and summary to, one JSON object per line
+    :param processes: size of the process pool, number of CPUs by default
+    :param seed: game with index i is played with seed + i, so every game is reproducible on its own
+    :return: summary of the tournament
+    """
+    assert 2 <= len(specs) <= 4
+    # fail early on bad specs
+    for spec in specs:
+        Agent(spec)
+
+    jobs = [(index, list(specs), seed + index) for index in range(games)]
+    results = []
+
+    with open(results_path, 'w') as out, Pool(processes, _init_worker, (decks_path,)) as pool:
+        for result in pool.imap_unordered(_play_game_worker, jobs):
+            results.append(result)
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+        summary = summarize(specs, results)
+        out.write(json.dumps(dict(summary=summary)) + "\n")
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play games between bots")
+    parser.add_argument('agents', nargs='+', help="agent specs, e.g. smart_ismcts:1000 minimax")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--decks', default='decks.txt')
+    parser.add_argument('--results', default='results.jsonl')
+    args = parser.parse_args()
+
+    summary = run_tournament(args.agents, args.games, args.results, args.processes, args.seed, args.decks)
+
+    print("{} games".format(summary['games']))
+    for agent in summary['agents']:
+        print("{agent}: {win_rate:.3f} [{ci95[0]:.3f}, {ci95[1]:.3f}]".format(**agent))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 from collections import defaultdict
-from copy import deepcopy
+from time import time
 
-from ismcts import ISMCTS
+from ismcts import ISMCTS, in_budget
 from node import Node
 from rule_based import get_move
+from stats import NULL_STATS
 from strategy import get_guess_card
 
 
@@ -13,54 +14,78 @@ class Determinized_UCT(ISMCTS):
         kwargs['random'] = False
         return super(Determinized_UCT, self).get_move_by_policy(state, untried_moves, **kwargs)
 
+    def apply_move(self, state, move, **kwargs):
+        # moves are recorded to bring the determinization back after the iteration
+        self.records.append(state.make_move(move, **kwargs))
+
     def select(self, state, node, **kwargs):
         kwargs['extra'] = True
         return super(Determinized_UCT, self).select(state, node, **kwargs)
 
-    def get_move(self, rootstate, itermax, verbose=True, **kwargs):
+    def get_move(self, rootstate, itermax=None, verbose=True, **kwargs):
         """ Conduct an ISMCTS search for itermax iterations starting from rootstate.
             Return the best move from the rootstate.
+            If budget argument is given, every tree gets an equal share of that many seconds.
+            If stats argument is given, statistic of the search is added to that SearchStats.
         """
-        print(rootstate.playerHands[rootstate.playerToMove])
+        assert itermax or kwargs.get('budget')
+        if verbose:
+            print(rootstate.playerHands[rootstate.playerToMove])
+        stats = kwargs.get('stats') or NULL_STATS
+        stats.begin()
         move, victim, guess = get_move(rootstate, ismcts=True)
 
         if move:
+            stats.end()
             return move, victim, guess
 
         moves = rootstate.get_moves()
 
         trees_number = kwargs.get('trees_number', 50)
+        start, budget = time(), kwargs.get('budget')
 
         decision_counter = defaultdict(int)
 
+        snapshot = rootstate.compact()
+        self.records = []
+        self.iterations = 0
         for j in range(trees_number):
-            state_copy = rootstate.clone_and_randomize()
+            # every tree searches a single determinization, moves are undone after each iteration
+            clock = stats.tick()
+            state = snapshot.clone_and_randomize(rng=self.rng)
+            stats.record('determinize', clock)
             rootnode = Node()
-            counter = 0
-            for i in range(itermax // trees_number):
-                state = deepcopy(state_copy)
+            iterations = 0
+            deadline = start + budget * (j + 1) / trees_number if budget else None
+            while in_budget(iterations, itermax and itermax // trees_number, deadline):
+                iterations += 1
                 node = rootnode
-                # determinize
+                clock = stats.tick()
                 node = self.select(state, node)
-                if counter == 5:
-                    print(rootnode.tree_to_string(indent=0))
+                clock = stats.record('select', clock)
                 node = self.expand(state, node)
-                if counter == 5:
-                    print(rootnode.tree_to_string(indent=0))
+                clock = stats.record('expand', clock)
+                moves_made = len(self.records)
                 self.simulate(state)
-                if counter == 5:
-                    print(rootnode.tree_to_string(indent=0))
+                stats.add_rollout(len(self.records) - moves_made)
+                clock = stats.record('simulate', clock)
                 self.backpropagate(state, node)
-                if counter == 5:
-                    print(rootnode.tree_to_string(indent=0))
-                    import pdb
-                    pdb.set_trace()
-                counter += 1
-            decision_counter[self.select_final_move(rootnode, rootstate)[0]] += 1
+                clock = stats.record('backpropagate', clock)
+                while self.records:
+                    state.undo_move(self.records.pop())
+                stats.record('undo', clock)
+            self.iterations += iterations
+            stats.add_tree(rootnode)
+            if rootnode.childNodes:
+                decision_counter[self.select_final_move(rootnode, rootstate)[0]] += 1
+        stats.add_iterations(self.iterations)
+        stats.end()
 
         # Output some information about the tree - can be omitted
-        print("{} -> {}".format(moves[0], decision_counter[moves[0]]))
-        print("{} -> {}".format(moves[1], decision_counter[moves[1]]))
+        if verbose:
+            print("{} -> {}".format(moves[0], decision_counter[moves[0]]))
+            print("{} -> {}".format(moves[1], decision_counter[moves[1]]))
+            print("{} iterations".format(self.iterations))
 
         if decision_counter[moves[0]] >= decision_counter[moves[1]]:
             if moves[0].name == "Guard":
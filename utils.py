@@ -0,0 +1,59 @@
+from collections import OrderedDict
+
+
+class TranspositionTable(object):
+    """
+    Statistics of searched information sets, bounded by capacity with the least recently used entries evicted first
+    """
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(snapshot, observer=None):
+        """
+        Canonical key of the information set of the observer, states indistinguishable for him have equal keys
+        no matter which order the moves were made in
+        :param snapshot: CompactState
+        :param observer: seat of the observer, the player to move by default
+        :return: hashable key
+        """
+        n = len(snapshot.uids)
+        if observer is None:
+            observer = snapshot.to_move
+        # cards seen by the observer and cards the opponents saw in his hand are known to him,
+        # he only knows if the opponents saw cards of each other
+        seen = tuple(mask if observer in (index // n, index % n) else bool(mask)
+                     for index, mask in enumerate(snapshot.seen))
+        return (observer, snapshot.to_move, tuple(sorted(snapshot.hands[observer])), snapshot.used, seen,
+                snapshot.wrong, snapshot.defence, snapshot.lost, len(snapshot.deck))
+
+    def get(self, key, default=None):
+        """
+        :return: value stored for the key, default if there is no one
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)